@@ -0,0 +1,213 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import librosa
+from engine import mfcc_features, dtw_distance, DTW_BAND, TemplateBank, MfccEngine
+
+RATE = 16000
+WINDOW = 15 * 1024
+
+
+def synth_sounds(rng):
+    t = np.arange(int(RATE * 0.6)) / RATE
+    clap = rng.normal(0, 1, len(t)) * np.exp(-t * 30)
+    click = np.zeros_like(t)
+    click[:200] = rng.normal(0, 1, 200)
+    whistle = np.sin(2 * np.pi * (1800 + 900 * t) * t) * np.minimum(1, t * 20)
+    knock = np.sin(2 * np.pi * 180 * t) * np.exp(-t * 18)
+    return {'clap': clap, 'click': click, 'whistle': whistle, 'knock': knock}
+
+
+def load_sounds(paths):
+    return {p: librosa.load(p, sr=RATE)[0] for p in paths}
+
+
+def place(sound, rng, noise):
+    y = rng.normal(0, noise, WINDOW)
+    rate = rng.uniform(0.85, 1.15)
+    stretched = librosa.effects.time_stretch(sound, rate=rate)[:WINDOW]
+    offset = rng.integers(0, WINDOW - len(stretched) + 1)
+    y[offset:offset + len(stretched)] += stretched * rng.uniform(0.3, 1.0)
+    return y.astype(np.float32)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def bench_dtw(args):
+    from fastdtw import fastdtw
+    from scipy.spatial.distance import euclidean
+
+    rng = np.random.default_rng(args.seed)
+    sounds = load_sounds(args.wav) if args.wav else synth_sounds(rng)
+    templates = {name: mfcc_features(y, RATE) for name, y in sounds.items()}
+    rows = []
+    for name, sound in sounds.items():
+        for _ in range(args.windows):
+            window = mfcc_features(place(sound, rng, args.noise), RATE)
+            for tname, template in templates.items():
+                frames = template.shape[0]
+                ref, t_ref = timed(lambda: fastdtw(window, template, dist=euclidean)[0], 1)
+                full, t_full = timed(lambda: dtw_distance(window, template, band=None), 3)
+                banded, t_band = timed(lambda: dtw_distance(window, template), 3)
+                rows.append((name == tname, ref / frames, full / frames, banded / frames,
+                             t_ref, t_full, t_band))
+    data = np.array(rows, dtype=np.float64)
+    same, ref, full, banded = data[:, 0].astype(bool), data[:, 1], data[:, 2], data[:, 3]
+
+    print(f"pairs: {len(data)} ({same.sum()} matching, {(~same).sum()} non-matching), "
+          f"noise={args.noise}, source={'wav' if args.wav else 'synthetic'}")
+    print(f"{'engine':<22}{'median ms':>10}{'p99 ms':>10}{'speed-up':>10}"
+          f"{'mean |Δ|/ref':>14}{'max |Δ|/ref':>13}{'rank corr':>11}")
+    ref_ms = np.median(data[:, 4]) * 1e3
+    for label, values, col in (("fastdtw (radius=1)", ref, 4),
+                               ("dtw_distance full", full, 5),
+                               (f"dtw_distance band={DTW_BAND}", banded, 6)):
+        ms = data[:, col] * 1e3
+        rel = np.abs(values - ref) / ref
+        corr = np.corrcoef(np.argsort(np.argsort(values)), np.argsort(np.argsort(ref)))[0, 1]
+        print(f"{label:<22}{np.median(ms):>10.3f}{np.percentile(ms, 99):>10.3f}"
+              f"{ref_ms / np.median(ms):>10.1f}{rel.mean():>14.4f}{rel.max():>13.4f}{corr:>11.4f}")
+
+    print("\nthreshold agreement with fastdtw (same trigger / no-trigger decision):")
+    for q in (0.05, 0.1, 0.25):
+        threshold = np.quantile(ref, q)
+        agree_full = np.mean((full < threshold) == (ref < threshold))
+        agree_band = np.mean((banded < threshold) == (ref < threshold))
+        print(f"  threshold={threshold:8.2f} (q{int(q * 100):02d})  full {agree_full:6.1%}  banded {agree_band:6.1%}")
+
+    print("\nseparation (median normalized distance, matching vs non-matching):")
+    for label, values in (("fastdtw", ref), ("full", full), ("banded", banded)):
+        print(f"  {label:<8}{np.median(values[same]):10.2f}{np.median(values[~same]):10.2f}")
+
+
+def bench_bank(args):
+    rng = np.random.default_rng(args.seed)
+    sounds = list(synth_sounds(rng).values())
+    window = mfcc_features(place(sounds[0], rng, 0.01), RATE)
+    print(f"{'profiles':>9}{'loop ms':>10}{'batch ms':>10}{'speed-up':>10}")
+    for count in args.profiles:
+        models = {}
+        for i in range(count):
+            sound = sounds[i % len(sounds)]
+            y = librosa.effects.time_stretch(sound, rate=rng.uniform(0.6, 1.6))
+            features = mfcc_features(y, RATE)
+            models[str(i)] = {'mfcc': features, 'frames': features.shape[0]}
+        bank = TemplateBank()
+        bank.rebuild(models)
+        _, t_loop = timed(lambda: [dtw_distance(window, m['mfcc']) for m in models.values()], args.repeat)
+        _, t_batch = timed(lambda: bank.match(window), args.repeat)
+        print(f"{count:>9}{t_loop * 1e3:>10.2f}{t_batch * 1e3:>10.2f}{t_loop / t_batch:>10.1f}")
+
+
+STARTUP_PROBES = {
+    "main": "import main",
+    "engine": "import engine",
+    "librosa": "import librosa; librosa.feature.mfcc",
+    "scipy.signal": "import scipy.signal",
+}
+
+
+def librosa_mfcc(y, sr):
+    y = librosa.util.normalize(y)
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, n_fft=512, hop_length=256)
+    return np.vstack([mfcc, librosa.feature.delta(mfcc), librosa.feature.delta(mfcc, order=2)]).T
+
+
+def bench_mfcc(args):
+    rng = np.random.default_rng(args.seed)
+    engine = MfccEngine(RATE)
+    sounds = list(synth_sounds(rng).values())
+    worst = 0.0
+    print(f"{'samples':>8}{'librosa ms':>12}{'engine ms':>11}{'speed-up':>10}{'max |Δ|':>11}{'max |x|':>10}")
+    for samples in args.lengths:
+        y = place(sounds[0], rng, args.noise) if samples == WINDOW else rng.normal(0, args.noise, samples)
+        y = y.astype(np.float32)
+        librosa_mfcc(y, RATE), engine.features(y)
+        ref, t_ref = timed(lambda: librosa_mfcc(y, RATE), args.repeat)
+        out, t_engine = timed(lambda: engine.features(y), args.repeat)
+        diff = np.abs(out - ref).max()
+        worst = max(worst, diff)
+        print(f"{samples:>8}{t_ref * 1e3:>12.3f}{t_engine * 1e3:>11.3f}{t_ref / t_engine:>10.1f}"
+              f"{diff:>11.2e}{np.abs(ref).max():>10.1f}")
+    ok = worst <= args.tolerance
+    print(f"\ntolerance {args.tolerance:g}: {'OK' if ok else 'EXCEEDED'}")
+    if not ok:
+        sys.exit(1)
+
+
+def import_time(statement, env):
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def top_imports(module, env, count):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, env=env,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def bench_startup(args):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    print(f"{'module':<16}{'median ms':>10}{'max ms':>10}")
+    results = {}
+    for module, statement in STARTUP_PROBES.items():
+        times = np.array([import_time(statement, env) for _ in range(args.repeat)]) * 1e3
+        results[module] = np.median(times)
+        print(f"{module:<16}{np.median(times):>10.1f}{times.max():>10.1f}")
+    print("\nslowest imports under 'import main' (cumulative ms):")
+    for us, name in top_imports("main", env, args.top):
+        print(f"  {us / 1e3:>8.1f}  {name}")
+    ok = results['main'] <= args.budget
+    print(f"\nbudget {args.budget:.0f} ms: {'OK' if ok else 'EXCEEDED'}")
+    if not ok:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SonicTrigger micro-benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+    dtw = sub.add_parser('dtw', help="dtw_distance vs fastdtw accuracy and speed")
+    dtw.add_argument('wav', nargs='*', help="template sounds (default: synthetic set)")
+    dtw.add_argument('--windows', type=int, default=8, help="windows per sound")
+    dtw.add_argument('--noise', type=float, default=0.01)
+    dtw.add_argument('--seed', type=int, default=0)
+    dtw.set_defaults(func=bench_dtw)
+    bank = sub.add_parser('bank', help="per-profile loop vs batched TemplateBank")
+    bank.add_argument('--profiles', type=int, nargs='+', default=[1, 5, 15, 30, 60])
+    bank.add_argument('--repeat', type=int, default=10)
+    bank.add_argument('--seed', type=int, default=0)
+    bank.set_defaults(func=bench_bank)
+    mfcc = sub.add_parser('mfcc', help="NumPy MfccEngine vs librosa accuracy and speed")
+    mfcc.add_argument('--lengths', type=int, nargs='+', default=[4800, WINDOW, 16000, 48000])
+    mfcc.add_argument('--repeat', type=int, default=20)
+    mfcc.add_argument('--noise', type=float, default=0.05)
+    mfcc.add_argument('--tolerance', type=float, default=1e-3)
+    mfcc.add_argument('--seed', type=int, default=0)
+    mfcc.set_defaults(func=bench_mfcc)
+    startup = sub.add_parser('startup', help="cold import time of main.py against a budget")
+    startup.add_argument('--budget', type=float, default=300.0, help="max median 'import main' time, ms")
+    startup.add_argument('--repeat', type=int, default=5)
+    startup.add_argument('--top', type=int, default=8)
+    startup.set_defaults(func=bench_startup)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2067 @@
+import threading
+import queue
+from collections import deque
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import os
+import json
+import time
+import uuid
+import hashlib
+import mmap
+import struct
+import zlib
+from pathlib import Path
+import subprocess
+import sys
+import warnings
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+warnings.filterwarnings("ignore")
+
+DTW_BAND = 0.25
+ABANDON_STRIDE = 4
+
+def hann_window(n):
+    """Периодическое окно Ханна (как scipy get_window('hann', n, fftbins=True))."""
+    return np.hanning(n + 1)[:-1]
+
+def hz_to_mel(freqs):
+    """Шкала мел Слейни (как librosa.hz_to_mel с htk=False)."""
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=np.float64))
+    mels = freqs / (200.0 / 3)
+    log_region = freqs >= 1000.0
+    mels[log_region] = 15.0 + np.log(freqs[log_region] / 1000.0) / (np.log(6.4) / 27.0)
+    return mels
+
+def mel_to_hz(mels):
+    mels = np.atleast_1d(np.asarray(mels, dtype=np.float64))
+    freqs = mels * (200.0 / 3)
+    log_region = mels >= 15.0
+    freqs[log_region] = 1000.0 * np.exp(np.log(6.4) / 27.0 * (mels[log_region] - 15.0))
+    return freqs
+
+def mel_filterbank(sr, n_fft, n_mels):
+    """Треугольные фильтры с нормировкой Слейни (как librosa.filters.mel)."""
+    fft_freqs = np.fft.rfftfreq(n_fft, 1.0 / sr)
+    mel_f = mel_to_hz(np.linspace(hz_to_mel(0.0)[0], hz_to_mel(sr / 2.0)[0], n_mels + 2))
+    fdiff = np.diff(mel_f)
+    ramps = mel_f[:, None] - fft_freqs[None, :]
+    lower = -ramps[:-2] / fdiff[:-1, None]
+    upper = ramps[2:] / fdiff[1:, None]
+    weights = np.maximum(0.0, np.minimum(lower, upper))
+    weights *= (2.0 / (mel_f[2:] - mel_f[:-2]))[:, None]
+    return weights.astype(np.float32)
+
+def dct_matrix(n_out, n_in):
+    """Ортонормированная матрица DCT-II (первые n_out коэффициентов)."""
+    k = np.arange(n_out)[:, None]
+    n = np.arange(n_in)[None, :]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2 * n_in)) * np.sqrt(2.0 / n_in)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+def delta_matrix(n, width, order):
+    """Матрица D (n × n): features @ D — дельта порядка order по кадрам.
+
+    Повторяет savgol_filter(mode='interp'), который использует
+    librosa.feature.delta: внутри — свёртка Савицкого-Голея, у краёв —
+    полином, подогнанный к первым/последним width кадрам.
+    """
+    width = min(width, n)
+    half = width // 2
+    matrix = np.zeros((n, n))
+    factorial = float(np.prod(np.arange(1, order + 1)))
+    for i in range(n):
+        start = min(max(i - half, 0), n - width)
+        t = np.arange(start, start + width) - i
+        vander = t[:, None] ** np.arange(order + 1)[None, :].astype(np.float64)
+        matrix[start:start + width, i] = np.linalg.pinv(vander)[order] * factorial
+    return matrix
+
+class MfccEngine:
+    """MFCC + дельты на NumPy для фиксированных параметров.
+
+    Окно, мел-фильтры, DCT и матрицы дельт строятся один раз; кадр проходит
+    цепочку rfft → мел → дБ → DCT → дельты матричными умножениями в заранее
+    выделенные буферы. Совпадает с librosa.feature.mfcc + delta (center=True,
+    нулевое дополнение, top_db=80) с точностью ~1e-4 (bench.py mfcc).
+    Экземпляр не потокобезопасен: см. mfcc_engine().
+    """
+    N_MFCC = 13
+    N_FFT = 512
+    HOP_LENGTH = 256
+    N_MELS = 128
+    TOP_DB = 80.0
+    AMIN = 1e-10
+    DELTA_WIDTH = 9
+    MAX_SHAPES = 32
+    
+    def __init__(self, rate):
+        self.rate = rate
+        self.window = hann_window(self.N_FFT).astype(np.float32)
+        self.mel_basis = mel_filterbank(rate, self.N_FFT, self.N_MELS)
+        self.dct_basis = dct_matrix(self.N_MFCC, self.N_MELS)
+        self.shapes = {}
+    
+    def buffers(self, n_frames):
+        buffers = self.shapes.get(n_frames)
+        if buffers is None:
+            if len(self.shapes) >= self.MAX_SHAPES:
+                self.shapes.clear()
+            buffers = {
+                'frames': np.empty((n_frames, self.N_FFT), dtype=np.float32),
+                'mel': np.empty((self.N_MELS, n_frames)),
+                'mfcc': np.empty((self.N_MFCC, n_frames)),
+                'delta1': delta_matrix(n_frames, self.DELTA_WIDTH, 1),
+                'delta2': delta_matrix(n_frames, self.DELTA_WIDTH, 2)
+            }
+            self.shapes[n_frames] = buffers
+        return buffers
+    
+    def power(self, frames):
+        spectrum = np.fft.rfft(frames, axis=-1)
+        return spectrum.real ** 2 + spectrum.imag ** 2
+    
+    def cepstrum(self, db, out=None):
+        """DCT лог-мел спектрограммы (n_mels × кадры) и её дельты → (кадры, 39)."""
+        n_frames = db.shape[1]
+        buffers = self.buffers(n_frames)
+        if out is None:
+            out = np.empty((n_frames, 3 * self.N_MFCC))
+        mfcc = np.matmul(self.dct_basis, db, out=buffers['mfcc'])
+        k = self.N_MFCC
+        out[:, :k] = mfcc.T
+        np.matmul(buffers['delta1'].T, mfcc.T, out=out[:, k:2 * k])
+        np.matmul(buffers['delta2'].T, mfcc.T, out=out[:, 2 * k:])
+        return out
+    
+    def features(self, y, out=None):
+        y = np.asarray(y, dtype=np.float32)
+        peak = np.abs(y).max() if len(y) else 0.0
+        if peak > np.finfo(np.float32).tiny:
+            y = y / peak
+        pad = self.N_FFT // 2
+        y = np.pad(y, (pad, pad))
+        n_frames = 1 + (len(y) - self.N_FFT) // self.HOP_LENGTH
+        buffers = self.buffers(n_frames)
+        frames = np.multiply(sliding_window_view(y, self.N_FFT)[::self.HOP_LENGTH], self.window,
+                             out=buffers['frames'])
+        db = buffers['mel']
+        db[:] = self.mel_basis @ self.power(frames).T
+        np.maximum(db, self.AMIN, out=db)
+        np.log10(db, out=db)
+        db *= 10.0
+        np.maximum(db, db.max() - self.TOP_DB, out=db)
+        return self.cepstrum(db, out)
+
+_ENGINES = threading.local()
+
+def mfcc_engine(rate):
+    """MfccEngine для текущего потока (буферы не разделяются между потоками)."""
+    engines = getattr(_ENGINES, 'by_rate', None)
+    if engines is None:
+        engines = _ENGINES.by_rate = {}
+    engine = engines.get(rate)
+    if engine is None:
+        engine = engines[rate] = MfccEngine(rate)
+    return engine
+
+def mfcc_features(y, sr):
+    return mfcc_engine(sr).features(y)
+
+def frame_distances(query, template):
+    query = np.asarray(query, dtype=np.float64)
+    template = np.asarray(template, dtype=np.float64)
+    sq = np.einsum('ij,ij->i', query, query)[:, None] + np.einsum('ij,ij->i', template, template)[None, :]
+    sq -= 2.0 * (query @ template.T)
+    return np.sqrt(np.maximum(sq, 0.0, out=sq), out=sq)
+
+def band_limits(n, m, band):
+    """Границы полосы Сако-Чиба [lo, hi] для каждой строки матрицы n × m."""
+    if band is None or n < 2:
+        return np.zeros(n, dtype=np.int64), np.full(n, m - 1, dtype=np.int64)
+    slope = (m - 1) / (n - 1)
+    radius = max(int(np.ceil(band * max(n, m))), int(np.ceil(slope)), 1)
+    center = np.arange(n) * slope
+    lo = np.clip(np.floor(center - radius), 0, m - 1).astype(np.int64)
+    hi = np.clip(np.ceil(center + radius), 0, m - 1).astype(np.int64)
+    return lo, hi
+
+def band_mask(n, lengths, width, band):
+    """Штраф (n × P × width): 0 внутри полосы, inf вне её и за концом шаблона."""
+    cols = np.arange(width)
+    outside = np.full((n, len(lengths), width), np.inf)
+    for p, m in enumerate(lengths):
+        lo, hi = band_limits(n, int(m), band)
+        outside[:, p][(cols[None, :] >= lo[:, None]) & (cols[None, :] <= hi[:, None])] = 0.0
+    return outside
+
+def template_envelopes(templates, lengths, n, band=DTW_BAND):
+    """Огибающие LB_Keogh (P × n × D): покадровые минимум и максимум шаблона
+    по столбцам полосы каждой строки окна длиной n кадров.
+
+    Минимумы по полосам берутся из разреженной таблицы: на уровне k — минимум
+    по 2^k соседним кадрам, отрезок [lo, hi] покрывают два перекрывающихся
+    блока одного уровня. Так вся таблица считается O(log M) векторными шагами.
+    """
+    templates = np.asarray(templates, dtype=np.float64)
+    lower = np.empty((len(lengths), n, templates.shape[2]))
+    upper = np.empty_like(lower)
+    if not len(lengths) or not n:
+        return lower, upper
+    limits = [band_limits(n, int(m), band) for m in lengths]
+    lo = np.array([l for l, _ in limits])
+    hi = np.array([h for _, h in limits])
+    level = np.log2(hi - lo + 1).astype(np.int64)
+    mins = maxs = templates
+    for k in range(int(level.max()) + 1):
+        if k:
+            step = 1 << (k - 1)
+            mins = np.minimum(mins[:, :-step], mins[:, step:])
+            maxs = np.maximum(maxs[:, :-step], maxs[:, step:])
+        p, i = np.nonzero(level == k)
+        start, end = lo[p, i], hi[p, i] - (1 << k) + 1
+        lower[p, i] = np.minimum(mins[p, start], mins[p, end])
+        upper[p, i] = np.maximum(maxs[p, start], maxs[p, end])
+    return lower, upper
+
+def lb_keogh(query, lower, upper):
+    """Нижние границы DTW-стоимости окна для каждого шаблона.
+
+    Путь проходит через каждую строку окна хотя бы раз и внутри полосы, а
+    расстояние от кадра до ближайшей точки огибающей не больше расстояния
+    до любого кадра шаблона в этой полосе.
+    """
+    query = np.asarray(query, dtype=np.float64)[None]
+    excess = np.maximum(query - upper, 0.0) + np.maximum(lower - query, 0.0)
+    return np.sqrt(np.einsum('pnd,pnd->pn', excess, excess)).sum(axis=1)
+
+def dtw_batch_distances(query, templates, lengths, band=DTW_BAND, max_costs=None, outside=None):
+    """DTW одного окна против стека шаблонов (P × M × D, дополненных нулями).
+
+    Строки накопленной матрицы считаются векторно для всех шаблонов сразу:
+    горизонтальный переход внутри строки сводится к cumsum +
+    minimum.accumulate. Каждый путь проходит через каждую строку, поэтому
+    минимум строки — нижняя граница итоговой стоимости; шаблоны, у которых он
+    превысил max_costs, отбрасываются и получают inf. До прохода по строкам
+    так же отбрасываются шаблоны, у которых сумма минимумов строк в полосе
+    уже выше max_costs.
+    """
+    query = np.asarray(query, dtype=np.float64)
+    templates = np.asarray(templates, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    count, width = templates.shape[0], templates.shape[1]
+    n = len(query)
+    result = np.full(count, np.inf)
+    if count == 0 or n == 0:
+        return result
+    if outside is None:
+        outside = band_mask(n, lengths, width, band)
+    limits = None if max_costs is None else np.broadcast_to(
+        np.asarray(max_costs, dtype=np.float64), (count,))
+    
+    cost = np.tensordot(query, templates, axes=([1], [2]))
+    cost *= -2.0
+    cost += np.einsum('ij,ij->i', query, query)[:, None, None]
+    cost += np.einsum('pmd,pmd->pm', templates, templates)[None, :, :]
+    np.sqrt(np.maximum(cost, 0.0, out=cost), out=cost)
+    acc = np.cumsum(cost, axis=2)
+    
+    alive = np.arange(count)
+    if limits is not None:
+        ok = (cost + outside).min(axis=2).sum(axis=0) <= limits
+        kept = np.count_nonzero(ok)
+        if kept == 0:
+            return result
+        if kept <= count // 2:
+            alive = alive[ok]
+            cost, acc, outside = cost[:, ok], acc[:, ok], outside[:, ok]
+    prev = acc[0] + outside[0]
+    shifted = np.full((len(alive), width), np.inf)
+    steps = np.empty((len(alive), width))
+    for i in range(1, n):
+        if limits is not None and i % ABANDON_STRIDE == 0:
+            ok = prev.min(axis=1) <= limits[alive]
+            kept = np.count_nonzero(ok)
+            if kept == 0:
+                return result
+            if kept <= len(alive) // 2:
+                alive, prev, shifted, steps = alive[ok], prev[ok], shifted[ok], steps[ok]
+                cost, acc, outside = cost[:, ok], acc[:, ok], outside[:, ok]
+        shifted[:, 1:] = prev[:, :-1]
+        np.minimum(prev, shifted, out=steps)
+        steps += cost[i]
+        steps += outside[i]
+        steps -= acc[i]
+        np.minimum.accumulate(steps, axis=1, out=prev)
+        prev += acc[i]
+        prev += outside[i]
+    result[alive] = prev[np.arange(len(alive)), lengths[alive] - 1]
+    if limits is not None:
+        result[result > limits] = np.inf
+    return result
+
+def dtw_distance(query, template, band=DTW_BAND, max_cost=None):
+    """Стоимость DTW-выравнивания окна с одним шаблоном (inf при отсечении)."""
+    template = np.asarray(template)
+    return float(dtw_batch_distances(query, template[None], [len(template)], band, max_cost)[0])
+
+def dtw_path(query, template):
+    """Оптимальный путь полного DTW (без полосы) — список пар (i, j)."""
+    cost = frame_distances(query, template)
+    n, m = cost.shape
+    total = np.empty((n, m))
+    total[0] = np.cumsum(cost[0])
+    for i in range(1, n):
+        steps = cost[i].copy()
+        steps[0] += total[i - 1, 0]
+        steps[1:] += np.minimum(total[i - 1, 1:], total[i - 1, :-1])
+        acc = np.cumsum(cost[i])
+        total[i] = acc + np.minimum.accumulate(steps - acc)
+    i, j = n - 1, m - 1
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        if i == 0:
+            j -= 1
+        elif j == 0:
+            i -= 1
+        else:
+            move = np.argmin((total[i - 1, j - 1], total[i - 1, j], total[i, j - 1]))
+            i, j = (i - 1, j - 1) if move == 0 else (i - 1, j) if move == 1 else (i, j - 1)
+        path.append((i, j))
+    return path[::-1]
+
+def dba_average(sequences, initial, iterations=5):
+    """DTW Barycenter Averaging: кадры примеров, выровненные с текущим
+    средним, усредняются по позициям среднего; длина — как у initial."""
+    average = np.array(initial, dtype=np.float64)
+    for _ in range(iterations):
+        sums = np.zeros_like(average)
+        counts = np.zeros(len(average))
+        for sequence in sequences:
+            sequence = np.asarray(sequence, dtype=np.float64)
+            rows, cols = np.array(dtw_path(average, sequence)).T
+            np.add.at(sums, rows, sequence[cols])
+            counts += np.bincount(rows, minlength=len(average))
+        average = sums / counts[:, None]
+    return average
+
+class TemplateBank:
+    """Все обученные шаблоны, сложенные в один массив для пакетного DTW."""
+    def __init__(self, band=DTW_BAND):
+        self.band = band
+        self.ids = []
+        self.index = {}
+        self.frames = np.zeros(0)
+        self.templates = np.zeros((0, 0, 0))
+        self._masks = {}
+        self._envelopes = {}
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def rebuild(self, models):
+        self.ids = list(models)
+        self.index = {config_id: i for i, config_id in enumerate(self.ids)}
+        self.frames = np.array([models[i]['frames'] for i in self.ids], dtype=np.int64)
+        width = int(self.frames.max()) if len(self.ids) else 0
+        dims = models[self.ids[0]]['mfcc'].shape[1] if self.ids else 0
+        self.templates = np.zeros((len(self.ids), width, dims))
+        for i, config_id in enumerate(self.ids):
+            self.templates[i, :self.frames[i]] = models[config_id]['mfcc']
+        self._masks = {}
+        self._envelopes = {}
+    
+    def _mask(self, n):
+        if n not in self._masks:
+            self._masks[n] = band_mask(n, self.frames, self.templates.shape[1], self.band)
+        return self._masks[n]
+    
+    def _envelope(self, n):
+        if n not in self._envelopes:
+            self._envelopes[n] = template_envelopes(self.templates, self.frames, n, self.band)
+        return self._envelopes[n]
+    
+    def match(self, features, ids=None, thresholds=None, stats=None):
+        """Нормированные дистанции {config_id: distance} для выбранных профилей.
+
+        С порогами шаблоны, чья нижняя граница LB_Keogh уже выше порога,
+        получают inf без DTW. stats (словарь с ключами lower_bound, abandoned,
+        completed), если передан, накапливает, чем закончился каждый шаблон.
+        """
+        rows = np.arange(len(self.ids)) if ids is None else np.array(
+            [self.index[i] for i in ids], dtype=np.int64)
+        if not len(rows):
+            return {}
+        distances = np.full(len(rows), np.inf)
+        keep = np.ones(len(rows), dtype=bool)
+        max_costs = None
+        if thresholds is not None:
+            max_costs = np.asarray(thresholds, dtype=np.float64) * self.frames[rows]
+            lower, upper = self._envelope(len(features))
+            keep = lb_keogh(features, lower[rows], upper[rows]) <= max_costs
+            max_costs = max_costs[keep]
+        if keep.any():
+            distances[keep] = self._match_rows(features, rows[keep], max_costs)
+        if stats is not None:
+            completed = int(np.count_nonzero(np.isfinite(distances)))
+            stats['lower_bound'] += len(rows) - int(np.count_nonzero(keep))
+            stats['abandoned'] += int(np.count_nonzero(keep)) - completed
+            stats['completed'] += completed
+        return {self.ids[r]: float(d) for r, d in zip(rows, distances)}
+    
+    def _match_rows(self, features, rows, max_costs):
+        outside = self._mask(len(features))
+        templates, frames = self.templates, self.frames
+        if len(rows) < len(self.ids) or np.any(rows != np.arange(len(rows))):
+            templates, frames, outside = templates[rows], frames[rows], outside[:, rows]
+        return dtw_batch_distances(features, templates, frames, self.band, max_costs, outside) / frames
+
+_POOL_STATE = {}
+
+def _pool_worker_init(shm_name, band):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _POOL_STATE.update(shm=shm, bank=TemplateBank(band), models={})
+
+def _pool_worker_update(added, removed):
+    models = _POOL_STATE['models']
+    for key in removed:
+        models.pop(key, None)
+    models.update(added)
+    _POOL_STATE['bank'].rebuild(models)
+
+def _pool_worker_match(shape, thresholds, exact):
+    features = np.ndarray(shape, dtype=np.float64, buffer=_POOL_STATE['shm'].buf)
+    stats = dict.fromkeys(CascadeFilter.PRUNING, 0)
+    distances = _POOL_STATE['bank'].match(features, list(thresholds),
+                                          None if exact else list(thresholds.values()), stats)
+    return distances, stats
+
+class ProcessPoolMatcher:
+    """Пакетный DTW, распределённый по процессам.
+
+    Шаблоны делятся на шарды — не больше, чем ядер и шаблонов; шарды
+    создаются по мере роста банка, каждый живёт в своём однопроцессном пуле (контекст spawn: без fork при работающих потоках Tk и
+    PortAudio). update() отправляет шарду только добавленные и удалённые
+    шаблоны, поэтому переобучение профиля не перезапускает процессы. Признаки
+    окна передаются через общую память, в задачу уходят только пороги шарда.
+    """
+    MAX_FRAMES = 256
+    
+    def __init__(self, band, dims, workers=None):
+        self.band = band
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.MAX_FRAMES * max(dims, 1) * 8)
+        self.context = multiprocessing.get_context('spawn')
+        self.executors = []
+        self.loads = []
+        self.shard_of = {}
+        self.sources = {}
+    
+    def update(self, models):
+        """Приводит шарды к models ({ключ: модель}); новые шаблоны — в наименее загруженный шард."""
+        while len(self.executors) < min(self.workers, len(models)):
+            self.executors.append(ProcessPoolExecutor(max_workers=1, mp_context=self.context,
+                                                      initializer=_pool_worker_init,
+                                                      initargs=(self.shm.name, self.band)))
+            self.loads.append(0)
+        changes = [({}, []) for _ in self.executors]
+        for key in list(self.shard_of):
+            if key not in models or models[key]['mfcc'] is not self.sources[key]:
+                w = self.shard_of.pop(key)
+                self.loads[w] -= len(self.sources.pop(key))
+                changes[w][1].append(key)
+        added = [key for key in models if key not in self.shard_of]
+        for key in sorted(added, key=lambda k: -models[k]['frames']):
+            w = self.loads.index(min(self.loads))
+            mfcc = models[key]['mfcc']
+            changes[w][0][key] = {'mfcc': np.asarray(mfcc, dtype=np.float64), 'frames': len(mfcc)}
+            self.loads[w] += len(mfcc)
+            self.shard_of[key] = w
+            self.sources[key] = mfcc
+        for executor, (shard_added, removed) in zip(self.executors, changes):
+            if shard_added or removed:
+                executor.submit(_pool_worker_update, shard_added, removed)
+    
+    def match(self, features, ids, thresholds=None, stats=None):
+        exact = thresholds is None
+        if exact:
+            thresholds = [np.inf] * len(ids)
+        features = np.asarray(features, dtype=np.float64)
+        if len(features) > self.MAX_FRAMES:
+            raise ValueError("Окно длиннее буфера общей памяти")
+        np.ndarray(features.shape, dtype=np.float64, buffer=self.shm.buf)[:] = features
+        jobs = [{} for _ in self.executors]
+        for config_id, threshold in zip(ids, thresholds):
+            jobs[self.shard_of[config_id]][config_id] = threshold
+        futures = [executor.submit(_pool_worker_match, features.shape, job, exact)
+                   for executor, job in zip(self.executors, jobs) if job]
+        distances = {}
+        for future in futures:
+            shard, shard_stats = future.result()
+            distances.update(shard)
+            if stats is not None:
+                for key, value in shard_stats.items():
+                    stats[key] += value
+        return distances
+    
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+        self.executors = []
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception:
+            pass
+
+class SubsequenceMatcher:
+    """Subsequence DTW (открытые начало и конец) по потоку кадров.
+
+    Для каждого шаблона хранится столбец накопленной стоимости по последнему
+    кадру потока; новый кадр продлевает его одним векторным шагом, поэтому
+    перекрытие окон повторно не выравнивается. Оценка — стоимость лучшего
+    пути, заканчивающегося на текущем кадре, делённая на длину шаблона.
+
+    За один кадр потока путь продвигается по шаблону не больше чем на два
+    кадра, и такой прыжок оплачивает стоимость кадра шаблона, на который путь
+    приходит, дважды, поэтому шаблон не схлопывается на пару кадров:
+    совпадение требует хотя бы половины его длины в потоке.
+
+    Путь покрывает только сам звук, а не всё окно с тишиной вокруг, поэтому
+    оценки заметно меньше дистанций оконного режима (на записях свиста —
+    примерно вдвое). Пороги профилей для этого режима подбираются отдельно
+    (replay.py --mode subsequence).
+    """
+    def __init__(self):
+        self.ids = []
+        self.index = {}
+        self.frames = np.zeros(0, dtype=np.int64)
+        self.templates = np.zeros((0, 0, 0))
+        self.norms = np.zeros((0, 0))
+        self.column = np.zeros((0, 0))
+    
+    def rebuild(self, bank, ids=None):
+        rows = np.arange(len(bank.ids)) if ids is None else np.array(
+            [bank.index[i] for i in ids], dtype=np.int64)
+        self.ids = [bank.ids[r] for r in rows]
+        self.index = {config_id: i for i, config_id in enumerate(self.ids)}
+        self.frames = bank.frames[rows]
+        self.templates = bank.templates[rows]
+        self.norms = np.einsum('pmd,pmd->pm', self.templates, self.templates)
+        self.column = np.full(self.norms.shape, np.inf)
+    
+    def reset(self, config_ids=None):
+        if config_ids is None:
+            self.column[:] = np.inf
+            return
+        for config_id in config_ids:
+            if config_id in self.index:
+                self.column[self.index[config_id]] = np.inf
+    
+    def step(self, frames):
+        """Продлевает выравнивание на новые кадры; {config_id: лучшая оценка}."""
+        if not self.ids:
+            return {}
+        count = len(self.ids)
+        ends = np.arange(count), self.frames - 1
+        best = np.full(count, np.inf)
+        prev = self.column
+        for x in np.asarray(frames, dtype=np.float64):
+            cost = self.norms - 2.0 * (self.templates @ x) + x @ x
+            np.sqrt(np.maximum(cost, 0.0, out=cost), out=cost)
+            steps = prev.copy()
+            np.minimum(steps[:, 1:], prev[:, :-1], out=steps[:, 1:])
+            np.minimum(steps[:, 2:], prev[:, :-2] + cost[:, 2:], out=steps[:, 2:])
+            steps += cost
+            steps[:, 0] = cost[:, 0]
+            prev = steps
+            np.minimum(best, prev[ends] / self.frames, out=best)
+        self.column = prev
+        return {config_id: float(best[i]) for i, config_id in enumerate(self.ids)}
+
+class AudioRingBuffer:
+    """Предвыделенный кольцевой буфер float32 для захваченных сэмплов.
+
+    Каждый сэмпл пишется дважды (в позицию и в её зеркало через capacity),
+    поэтому последние n сэмплов всегда доступны одним непрерывным срезом
+    без копирования. int16-данные масштабируются в [-1, 1) на месте.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=np.float32)
+        self.pos = 0
+        self.written = 0
+    
+    def clear(self):
+        self.data[:] = 0
+        self.pos = 0
+        self.written = 0
+    
+    def _put(self, start, samples):
+        for offset in (start, start + self.capacity):
+            dst = self.data[offset:offset + len(samples)]
+            np.copyto(dst, samples, casting='unsafe')
+            if samples.dtype.kind in 'iu':
+                dst *= 1.0 / 32768.0
+    
+    def write(self, samples):
+        samples = np.asarray(samples)
+        total = len(samples)
+        if total > self.capacity:
+            samples = samples[-self.capacity:]
+        n = len(samples)
+        first = min(n, self.capacity - self.pos)
+        self._put(self.pos, samples[:first])
+        if first < n:
+            self._put(0, samples[first:])
+        self.pos = (self.pos + n) % self.capacity
+        self.written += total
+    
+    def latest(self, n):
+        end = self.pos + self.capacity
+        return self.data[end - n:end]
+
+def frame_stats(y, sr, n_fft=512, hop_length=256):
+    """Энергия и спектральный центроид каждого кадра (без дополнения краёв)."""
+    y = np.asarray(y, dtype=np.float32)
+    if len(y) < n_fft:
+        y = np.pad(y, (0, n_fft - len(y)))
+    frames = sliding_window_view(y, n_fft)[::hop_length]
+    spectrum = np.fft.rfft(frames * hann_window(n_fft), axis=-1)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    energy = power.sum(axis=1)
+    centroid = power @ np.fft.rfftfreq(n_fft, 1.0 / sr) / np.maximum(energy, 1e-20)
+    return energy, centroid
+
+def onset_offset(y, sr, hop_length=256):
+    """Смещение (с) первого кадра шаблона в пределах 20 дБ от пика."""
+    energy, _ = frame_stats(y, sr, hop_length=hop_length)
+    active = np.flatnonzero(energy >= energy.max() * 10 ** (-CascadeFilter.ACTIVE_DB / 10))
+    return float(active[0] * hop_length / sr) if len(active) else 0.0
+
+class CascadeFilter:
+    """Дешёвые проверки окна перед DTW: длительность, центроид, огибающая.
+
+    Сигнатура профиля считается при обучении, сводка окна — один раз на окно;
+    каждая проверка — несколько операций над векторами длиной в окно.
+    """
+    STAGES = ('volume', 'duration', 'centroid', 'envelope', 'dtw')
+    PRUNING = ('lower_bound', 'abandoned', 'completed')
+    ACTIVE_DB = 20.0
+    DURATION_RANGE = (0.5, 2.0)
+    DURATION_SLACK = 2
+    CENTROID_MARGIN = 0.25
+    CENTROID_MIN_MARGIN = 300.0
+    ENVELOPE_MIN_CORR = 0.5
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.rejected = dict.fromkeys(self.STAGES, 0)
+        self.pruning = dict.fromkeys(self.PRUNING, 0)
+        self.dtw_runs = 0
+    
+    @classmethod
+    def _envelope(cls, energy):
+        db = 10.0 * np.log10(np.maximum(energy, 1e-20) / max(energy.max(), 1e-20))
+        return np.maximum(db, -cls.ACTIVE_DB)
+    
+    @classmethod
+    def signature(cls, energy, centroid):
+        envelope = cls._envelope(energy)
+        active = np.flatnonzero(envelope > -cls.ACTIVE_DB)
+        if not len(active):
+            return None
+        low, high = np.percentile(centroid[active], [10, 90])
+        margin = max((high - low) * cls.CENTROID_MARGIN, cls.CENTROID_MIN_MARGIN)
+        return {
+            'duration': int(len(active)),
+            'centroid': (float(low - margin), float(high + margin)),
+            'envelope': envelope[active[0]:active[-1] + 1]
+        }
+    
+    @staticmethod
+    def merge(signatures, primary):
+        """Сигнатура профиля из нескольких примеров: длительность и огибающая
+        основного примера, диапазон центроида — объединение по всем."""
+        valid = [s for s in signatures if s is not None]
+        if signatures[primary] is None or len(valid) < len(signatures):
+            return None
+        merged = dict(signatures[primary])
+        merged['centroid'] = (min(s['centroid'][0] for s in valid), max(s['centroid'][1] for s in valid))
+        return merged
+    
+    @classmethod
+    def summarize(cls, energy, centroid):
+        envelope = cls._envelope(energy)
+        active = envelope > -cls.ACTIVE_DB
+        weights = energy[active]
+        return {
+            'duration': int(np.count_nonzero(active)),
+            'centroid': float(weights @ centroid[active] / max(weights.sum(), 1e-20)),
+            'envelope': envelope
+        }
+    
+    @staticmethod
+    def _correlation(envelope, template):
+        if len(template) > len(envelope):
+            envelope, template = template, envelope
+        if len(template) < 3:
+            return 1.0
+        windows = sliding_window_view(envelope, len(template))
+        windows = windows - windows.mean(axis=1, keepdims=True)
+        template = template - template.mean()
+        norms = np.linalg.norm(windows, axis=1) * np.linalg.norm(template)
+        if not norms.any():
+            return 1.0
+        return float(np.max(windows @ template / np.maximum(norms, 1e-12)))
+    
+    def check(self, summary, signature):
+        if signature is None:
+            return True
+        low, high = self.DURATION_RANGE
+        if not (signature['duration'] * low - self.DURATION_SLACK <= summary['duration']
+                <= signature['duration'] * high + self.DURATION_SLACK):
+            self.rejected['duration'] += 1
+            return False
+        c_low, c_high = signature['centroid']
+        if not c_low <= summary['centroid'] <= c_high:
+            self.rejected['centroid'] += 1
+            return False
+        if self._correlation(summary['envelope'], signature['envelope']) < self.ENVELOPE_MIN_CORR:
+            self.rejected['envelope'] += 1
+            return False
+        return True
+
+class OnsetDetector:
+    """Детектор начала звука: рост энергии блока над скользящим фоном."""
+    BLOCK = 256
+    RISE_DB = 9.0
+    BACKGROUND_RATE = 0.02
+    REFRACTORY = 0.3
+    
+    def __init__(self, rate):
+        self.rate = rate
+        self.reset()
+    
+    def reset(self):
+        self.background = None
+        self.position = 0
+        self.next_allowed = 0
+        self.armed = True
+    
+    def process(self, samples, min_level):
+        """Абсолютные позиции (в сэмплах) начал событий в очередном чанке."""
+        blocks = np.asarray(samples, dtype=np.float32)
+        blocks = blocks[:len(blocks) - len(blocks) % self.BLOCK].reshape(-1, self.BLOCK) / 32768.0
+        levels = 10.0 * np.log10(np.einsum('ij,ij->i', blocks, blocks) / self.BLOCK + 1e-12)
+        floor_db = 20.0 * np.log10(max(min_level, 1e-6))
+        onsets = []
+        for level in levels:
+            if self.background is None:
+                self.background = level
+            if (self.armed and level > self.background + self.RISE_DB and level > floor_db
+                    and self.position >= self.next_allowed):
+                onsets.append(self.position)
+                self.armed = False
+                self.next_allowed = self.position + int(self.REFRACTORY * self.rate)
+            elif level < self.background + self.RISE_DB / 2:
+                self.armed = True
+            if level < self.background:
+                self.background = level
+            else:
+                self.background += self.BACKGROUND_RATE * (level - self.background)
+            self.position += self.BLOCK
+        return onsets
+
+def build_sound_model(path, rate):
+    import librosa
+    y, sr = librosa.load(path, sr=rate)
+    if len(y) < rate * 0.3:
+        raise ValueError("Звук слишком короткий (мин. 0.3с)")
+    features = mfcc_features(y, sr)
+    return {
+        'mfcc': features,
+        'frames': features.shape[0],
+        'path': path,
+        'duration': len(y) / sr,
+        'signature': CascadeFilter.signature(*frame_stats(y, sr)),
+        'onset': onset_offset(y, sr)
+    }
+
+MAX_MEDOIDS = 3
+
+def build_profile_model(models):
+    """Модель профиля из одного или нескольких примеров звука.
+
+    Для нескольких примеров прототипами служат медоиды (жадно: каждая следующая
+    сильнее всего уменьшает сумму DTW-дистанций примеров до ближайшей медоиды,
+    их число растёт как корень из числа примеров) и DBA-усреднение примеров.
+    Остальные примеры сохраняются для уточнения, когда окно близко к прототипам.
+    """
+    if len(models) == 1:
+        return models[0]
+    features = [np.asarray(m['mfcc'], dtype=np.float64) for m in models]
+    count = len(features)
+    distances = np.zeros((count, count))
+    for i in range(count):
+        for j in range(i + 1, count):
+            scale = (len(features[i]) + len(features[j])) / 2
+            distances[i, j] = distances[j, i] = dtw_distance(features[i], features[j]) / scale
+    medoids = [int(np.argmin(distances.sum(axis=1)))]
+    for _ in range(min(MAX_MEDOIDS, max(1, int(np.sqrt(count)) - 1)) - 1):
+        nearest = distances[:, medoids].min(axis=1)
+        gains = np.maximum(nearest[:, None] - distances, 0).sum(axis=0)
+        gains[medoids] = -1
+        medoids.append(int(np.argmax(gains)))
+    average = dba_average(features, features[medoids[0]])
+    model = dict(models[medoids[0]])
+    model.update({
+        'prototypes': [{'mfcc': features[i], 'frames': len(features[i])} for i in medoids]
+                      + [{'mfcc': average, 'frames': len(average)}],
+        'examples': [{'mfcc': f, 'frames': len(f)} for i, f in enumerate(features) if i not in medoids],
+        'signature': CascadeFilter.merge([m.get('signature') for m in models], medoids[0]),
+        'paths': [m['path'] for m in models]
+    })
+    return model
+
+def model_templates(config_id, model):
+    """Шаблоны профиля для банка: ({ключ: шаблон} прототипов, {ключ: шаблон} примеров).
+
+    У профиля из одного примера единственный прототип хранится под его config_id.
+    """
+    if 'prototypes' not in model:
+        return {config_id: model}, {}
+    prototypes = {f"{config_id}#p{i}": t for i, t in enumerate(model['prototypes'])}
+    examples = {f"{config_id}#e{i}": t for i, t in enumerate(model['examples'])}
+    return prototypes, examples
+
+class TemplateCache:
+    """Кэш обученных шаблонов на диске: <ключ>.npy (признаки) + <ключ>.json.
+
+    Ключ — SHA-1 содержимого звукового файла и параметров признаков, поэтому
+    переименование файла не сбрасывает кэш, а изменение звука — сбрасывает.
+    Матрицы открываются через mmap. Старые записи вытесняются по возрасту и
+    по суммарному размеру (сначала давно не использованные).
+    """
+    FEATURE_PARAMS = {'n_mfcc': 13, 'n_fft': 512, 'hop_length': 256, 'version': 1}
+    MAX_BYTES = 256 * 1024 * 1024
+    MAX_AGE = 90 * 24 * 3600
+    
+    def __init__(self, directory, rate):
+        self.directory = Path(directory)
+        self.rate = rate
+    
+    def key(self, path):
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(json.dumps(dict(self.FEATURE_PARAMS, rate=self.rate), sort_keys=True).encode())
+        return digest.hexdigest()
+    
+    def load(self, path, key=None):
+        key = key or self.key(path)
+        npy, meta_path = self.directory / f"{key}.npy", self.directory / f"{key}.json"
+        if not (npy.exists() and meta_path.exists()):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            features = np.load(npy, mmap_mode='r')
+            os.utime(npy)
+            os.utime(meta_path)
+        except Exception:
+            return None
+        signature = meta.get('signature')
+        if signature:
+            signature['envelope'] = np.asarray(signature['envelope'])
+            signature['centroid'] = tuple(signature['centroid'])
+        return {
+            'mfcc': features,
+            'frames': features.shape[0],
+            'path': path,
+            'duration': meta['duration'],
+            'signature': signature,
+            'onset': meta.get('onset', 0.0)
+        }
+    
+    def store(self, model, key):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        signature = model.get('signature')
+        meta = {
+            'duration': model['duration'],
+            'onset': model.get('onset', 0.0),
+            'signature': None if signature is None else {
+                'duration': signature['duration'],
+                'centroid': list(signature['centroid']),
+                'envelope': np.asarray(signature['envelope']).tolist()
+            }
+        }
+        tmp = self.directory / f"{key}.{os.getpid()}.tmp.npy"
+        np.save(tmp, np.ascontiguousarray(model['mfcc']))
+        os.replace(tmp, self.directory / f"{key}.npy")
+        with open(self.directory / f"{key}.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        self.evict()
+    
+    def load_profile(self, paths):
+        models = [self.load(path) for path in paths]
+        if not models or any(m is None for m in models):
+            return None
+        return build_profile_model(models)
+    
+    def build_profile(self, paths):
+        return build_profile_model([self.get_or_build(path) for path in paths])
+    
+    def get_or_build(self, path):
+        key = self.key(path)
+        model = self.load(path, key)
+        if model is None:
+            model = build_sound_model(path, self.rate)
+            try:
+                self.store(model, key)
+            except Exception as e:
+                print(f"Template cache error: {e}")
+        return model
+    
+    def evict(self):
+        if not self.directory.exists():
+            return
+        now = time.time()
+        entries = []
+        for npy in self.directory.glob("*.npy"):
+            meta_path = npy.with_suffix('.json')
+            try:
+                stat = npy.stat()
+                size = stat.st_size + (meta_path.stat().st_size if meta_path.exists() else 0)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, size, npy, meta_path))
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        for mtime, size, npy, meta_path in entries:
+            if now - mtime <= self.MAX_AGE and total <= self.MAX_BYTES:
+                break
+            for p in (npy, meta_path):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+            total -= size
+
+def _train_worker(paths, cache_dir, rate):
+    return TemplateCache(cache_dir, rate).build_profile(paths)
+
+class StreamingFeatureExtractor:
+    """Потоковый MFCC: на каждый чанк считаются только новые кадры.
+
+    Хранит кольцо лог-мел кадров (до нормализации окна). Нормализация по пику,
+    клиппинг top_db, DCT и дельты применяются к окну целиком небольшими
+    матричными умножениями; два краевых кадра окна пересчитываются с нулевым
+    дополнением, как в пакетном librosa.feature.mfcc (center=True).
+    Расхождение с пакетным путём (extract_features) не превышает 1e-3 по
+    абсолютной величине признака. Возвращаемый массив переиспользуется
+    при следующем вызове features().
+    """
+    N_MFCC = 13
+    N_FFT = 512
+    HOP_LENGTH = 256
+    N_MELS = 128
+    TOP_DB = 80.0
+    AMIN_DB = -100.0
+    DELTA_WIDTH = 9
+    
+    def __init__(self, rate, chunk, window_samples, ring=None):
+        hop = self.HOP_LENGTH
+        if chunk % hop or window_samples % hop:
+            raise ValueError("Размер чанка и окна должен быть кратен hop_length")
+        self.rate = rate
+        self.chunk = chunk
+        self.window_samples = window_samples
+        self.n_frames = 1 + window_samples // hop
+        self.engine = MfccEngine(rate)
+        self.window = self.engine.window
+        self.mel_basis = self.engine.mel_basis
+        self.engine.buffers(self.n_frames)
+        self.db = np.empty((self.N_MELS, self.n_frames))
+        self.out = np.empty((self.n_frames, 3 * self.N_MFCC))
+        self.interior = self.n_frames - 2
+        self.mel_db = np.zeros((self.N_MELS, self.interior), dtype=np.float32)
+        self.energy = np.zeros(self.interior)
+        self.centroid = np.zeros(self.interior)
+        self.freqs = np.fft.rfftfreq(self.N_FFT, 1.0 / rate)
+        self.ring = ring if ring is not None else AudioRingBuffer(window_samples)
+        if self.ring.capacity < window_samples:
+            raise ValueError("Кольцевой буфер меньше окна анализа")
+        self.reset()
+    
+    def reset(self):
+        self.received = 0
+        self.next_center = self.HOP_LENGTH
+        self.ring_pos = 0
+        self.ring.clear()
+    
+    @property
+    def ready(self):
+        return self.received >= self.window_samples
+    
+    def _power(self, frames):
+        spectrum = np.fft.rfft(frames * self.window, axis=-1)
+        return spectrum.real ** 2 + spectrum.imag ** 2
+    
+    def _log_mel(self, power):
+        mel = self.mel_basis @ power.T
+        return 10.0 * np.log10(np.maximum(mel, 1e-30))
+    
+    def push(self, chunk):
+        n = len(chunk)
+        if n != self.chunk:
+            raise ValueError(f"Ожидался чанк из {self.chunk} сэмплов, получено {n}")
+        hop = self.HOP_LENGTH
+        self.ring.write(chunk)
+        self.received += n
+        base = self.received - self.window_samples
+        centers = range(self.next_center, self.received - hop + 1, hop)
+        if not len(centers):
+            return
+        self.next_center = centers[-1] + hop
+        y = self.ring.latest(self.window_samples)
+        frames = np.stack([y[c - hop - base:c + hop - base] for c in centers])
+        power = self._power(frames)
+        new_db = self._log_mel(power)
+        count = new_db.shape[1]
+        idx = (self.ring_pos + np.arange(count)) % self.interior
+        self.mel_db[:, idx] = new_db
+        self.energy[idx] = power.sum(axis=1)
+        self.centroid[idx] = power @ self.freqs / np.maximum(self.energy[idx], 1e-20)
+        self.ring_pos = (self.ring_pos + count) % self.interior
+    
+    def frame_stats(self):
+        order = (self.ring_pos + np.arange(self.interior)) % self.interior
+        return self.energy[order], self.centroid[order]
+    
+    def settled_frames(self, features):
+        """Кадры окна, которые только что получили полный контекст дельт."""
+        lookahead = self.DELTA_WIDTH // 2 + 1
+        count = self.chunk // self.HOP_LENGTH
+        return features[-(count + lookahead):-lookahead]
+    
+    def features(self):
+        if not self.ready:
+            return None
+        hop = self.HOP_LENGTH
+        y = self.ring.latest(self.window_samples)
+        order = (self.ring_pos + np.arange(self.interior)) % self.interior
+        edges = np.zeros((2, self.N_FFT), dtype=np.float32)
+        edges[0, hop:] = y[:hop]
+        edges[1, :hop] = y[-hop:]
+        edge_db = self._log_mel(self._power(edges))
+        db = self.db
+        db[:, 0] = edge_db[:, 0]
+        db[:, 1:-1] = self.mel_db[:, order]
+        db[:, -1] = edge_db[:, 1]
+        peak = max(y.max(), -y.min())
+        if peak > np.finfo(np.float32).tiny:
+            db -= 20.0 * np.log10(peak)
+        np.maximum(db, self.AMIN_DB, out=db)
+        np.maximum(db, db.max() - self.TOP_DB, out=db)
+        return self.engine.cepstrum(db, self.out)
+
+def profile_paths(data):
+    """Все примеры звука профиля: основной и дополнительные."""
+    return [p for p in [data.get('sound_path', '')] + list(data.get('extra_sounds', [])) if p]
+
+def read_config(path):
+    """Читает файл конфигурации: (settings, profiles). Поддерживает старый формат-список."""
+    with open(path, 'r', encoding='utf-8') as f:
+        configs = json.load(f)
+    if isinstance(configs, dict):
+        return configs.get('settings', {}), configs.get('profiles', [])
+    return {}, configs
+
+def write_config(path, settings, profiles):
+    """Записывает конфигурацию атомарно: во временный файл рядом, затем os.replace."""
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'settings': settings, 'profiles': profiles}, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp.exists():
+            os.remove(tmp)
+        raise
+
+class Action:
+    """Разрешённый путь приложения профиля: команда запуска без промежуточной оболочки."""
+    
+    def __init__(self, path, argv, cwd):
+        self.path = path
+        self.argv = argv
+        self.cwd = cwd
+    
+    def launch(self):
+        if self.argv is None:
+            os.startfile(self.path)
+        else:
+            subprocess.Popen(self.argv, cwd=self.cwd, close_fds=True)
+
+def resolve_action(exe_path):
+    """Action для пути из профиля; None, если путь пуст, FileNotFoundError — если файла нет.
+
+    Исполняемые файлы запускаются напрямую; .bat/.cmd — через cmd /c; прочие
+    файлы открываются связанным приложением (os.startfile, xdg-open/open).
+    """
+    path = exe_path.strip()
+    if not path:
+        return None
+    path = os.path.abspath(os.path.expanduser(path))
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Приложение не найдено: {path}")
+    ext = os.path.splitext(path)[1].lower()
+    if os.name == 'nt':
+        if ext in ('.bat', '.cmd'):
+            argv = [os.environ.get('COMSPEC', 'cmd.exe'), '/c', path]
+        else:
+            argv = [path] if ext in ('.exe', '.com') else None
+    elif os.access(path, os.X_OK):
+        argv = [path]
+    else:
+        argv = ['open' if sys.platform == 'darwin' else 'xdg-open', path]
+    return Action(path, argv, os.path.dirname(path))
+
+class ActionDispatcher:
+    """Запуск приложений профилей в отдельном потоке.
+
+    submit() только кладёт задание в очередь, поэтому его можно вызывать из
+    потока анализа. Повторный запуск того же пути в пределах COLLAPSE_WINDOW
+    секунд схлопывается. Для каждого профиля хранится задержка от окна,
+    давшего срабатывание, до старта процесса; on_result(config, error)
+    вызывается в потоке диспетчера после каждой попытки. Общая задержка
+    пишется и в этап 'dispatch' таймеров движка.
+    """
+    COLLAPSE_WINDOW = 2.0
+    WINDOW = 64
+    
+    def __init__(self, timers=None, on_result=None):
+        self.timers = timers
+        self.on_result = on_result
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.last_launch = {}
+        self.latencies = {}
+        self.collapsed = {}
+        self.failed = {}
+    
+    def submit(self, config, detected):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        self.jobs.put((config, detected))
+    
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            config, detected = job
+            error = None
+            try:
+                self.dispatch(config, detected)
+            except Exception as e:
+                error = e
+                self.failed[config.config_id] = self.failed.get(config.config_id, 0) + 1
+            if self.on_result is not None:
+                self.on_result(config, error)
+    
+    def dispatch(self, config, detected):
+        if config.action_error is not None:
+            raise config.action_error
+        action = config.action
+        if action is None:
+            return
+        last = self.last_launch.get(action.path)
+        if last is not None and detected - last < self.COLLAPSE_WINDOW:
+            self.collapsed[config.config_id] = self.collapsed.get(config.config_id, 0) + 1
+            return
+        self.last_launch[action.path] = detected
+        action.launch()
+        latency = time.perf_counter() - detected
+        self.latencies.setdefault(config.config_id, deque(maxlen=self.WINDOW)).append(latency)
+        if self.timers is not None:
+            self.timers.add('dispatch', latency)
+    
+    def snapshot(self):
+        """{config_id: {launches, collapsed, failed, p50_ms, max_ms}} по последним WINDOW запускам."""
+        result = {}
+        for config_id in set(self.latencies) | set(self.collapsed) | set(self.failed):
+            values = np.array(self.latencies.get(config_id, ()), dtype=np.float64) * 1e3
+            result[config_id] = {
+                'launches': len(values),
+                'collapsed': self.collapsed.get(config_id, 0),
+                'failed': self.failed.get(config_id, 0),
+                'p50_ms': float(np.percentile(values, 50)) if len(values) else None,
+                'max_ms': float(values.max()) if len(values) else None
+            }
+        return result
+    
+    def close(self):
+        if self.thread is not None:
+            self.jobs.put(None)
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+class Profile:
+    """Данные профиля отдельно от интерфейса: в GUI их показывает ConfigPanel из ProfileList."""
+    
+    def __init__(self, data):
+        self.config_id = data.get('id') or str(uuid.uuid4())
+        self.data = {
+            'name': data.get('name', ''),
+            'sound_path': data.get('sound_path', ''),
+            'extra_sounds': list(data.get('extra_sounds', [])),
+            'exe_path': data.get('exe_path', ''),
+            'threshold': data.get('threshold', 2.5),
+            'min_volume': data.get('min_volume', 0.008),
+            'enabled': data.get('enabled', True)
+        }
+        self.sound_model = None
+        self.is_trained = False
+        self.last_trigger = 0
+        self.cooldown = 1.2
+        self.resolve_action()
+    
+    def apply_model(self, model, error=None):
+        self.sound_model = model if error is None else None
+        self.is_trained = error is None
+    
+    def to_dict(self):
+        return {'id': self.config_id, **self.data, 'extra_sounds': list(self.data['extra_sounds'])}
+    
+    def resolve_action(self):
+        try:
+            self.action, self.action_error = resolve_action(self.data['exe_path']), None
+        except OSError as e:
+            self.action, self.action_error = None, e
+
+class ProfileBundle:
+    """Профили вместе с готовыми шаблонами в одном файле — для раздачи на другие машины.
+
+    Формат: заголовок (HEADER_SIZE байт: магия, версия, смещение, длина и CRC32
+    оглавления), дальше матрицы признаков, выровненные по ALIGN байт, и
+    JSON-оглавление: настройки, параметры признаков, данные профилей и для
+    каждой матрицы — смещение, форма и тип. Файл открывается через mmap:
+    чтение разбирает только оглавление, шаблоны — представления над mmap,
+    страницы подгружаются при первом обращении.
+
+    Сохранение дописывает в конец только матрицы, которых в файле ещё нет
+    (по SHA-1 содержимого), и новое оглавление, а после fsync перезаписывает
+    заголовок. Сбой до записи заголовка оставляет целой прежнюю версию. Когда
+    мёртвых байт становится больше живых, файл переписывается целиком во
+    временный и подменяется через os.replace.
+    """
+    MAGIC = b'STBUNDLE'
+    VERSION = 1
+    HEADER = struct.Struct('<8sIQQI')
+    HEADER_SIZE = 64
+    ALIGN = 64
+    COMPACT_MIN_BYTES = 1 << 20
+    
+    def __init__(self, path):
+        self.path = Path(path)
+    
+    @staticmethod
+    def params(rate):
+        return dict(TemplateCache.FEATURE_PARAMS, rate=rate)
+    
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) < self.HEADER_SIZE:
+            mm.close()
+            raise ValueError(f"Не файл профилей SonicTrigger: {self.path}")
+        magic, version, offset, length, crc = self.HEADER.unpack_from(mm, 0)
+        raw = mm[offset:offset + length]
+        if magic != self.MAGIC or version > self.VERSION or len(raw) != length or zlib.crc32(raw) != crc:
+            mm.close()
+            raise ValueError(f"Файл профилей повреждён или другой версии: {self.path}")
+        return mm, json.loads(raw)
+    
+    @staticmethod
+    def _view(mm, ref):
+        shape = tuple(ref['shape'])
+        return np.frombuffer(mm, dtype=ref['dtype'], count=int(np.prod(shape)),
+                             offset=ref['offset']).reshape(shape)
+    
+    def read(self, rate):
+        """(settings, [Profile]); профили с шаблонами под те же параметры признаков сразу обучены."""
+        mm, index = self._open()
+        blobs = index['blobs']
+        usable = index['params'] == self.params(rate)
+        profiles = []
+        for entry in index['profiles']:
+            profile = Profile(entry['data'])
+            if usable and entry['model'] is not None:
+                profile.apply_model(self._decode(entry['model'], lambda digest: self._view(mm, blobs[digest])))
+            profiles.append(profile)
+        return index['settings'], profiles
+    
+    @staticmethod
+    def _decode(encoded, array):
+        mfcc = array(encoded['mfcc'])
+        signature = encoded['signature']
+        if signature is not None:
+            signature = {'duration': signature['duration'], 'centroid': tuple(signature['centroid']),
+                         'envelope': array(signature['envelope'])}
+        model = {'mfcc': mfcc, 'frames': mfcc.shape[0], 'path': encoded['path'],
+                 'duration': encoded['duration'], 'signature': signature, 'onset': encoded['onset']}
+        for key in ('prototypes', 'examples'):
+            if key in encoded:
+                model[key] = [{'mfcc': t, 'frames': t.shape[0]} for t in map(array, encoded[key])]
+        if 'paths' in encoded:
+            model['paths'] = list(encoded['paths'])
+        return model
+    
+    @staticmethod
+    def _encode(model, put):
+        signature = model.get('signature')
+        encoded = {
+            'mfcc': put(model['mfcc']),
+            'path': model.get('path'),
+            'duration': float(model['duration']),
+            'onset': float(model.get('onset', 0.0)),
+            'signature': None if signature is None else {
+                'duration': float(signature['duration']),
+                'centroid': [float(c) for c in signature['centroid']],
+                'envelope': put(signature['envelope'])
+            }
+        }
+        for key in ('prototypes', 'examples'):
+            if key in model:
+                encoded[key] = [put(t['mfcc']) for t in model[key]]
+        if 'paths' in model:
+            encoded['paths'] = list(model['paths'])
+        return encoded
+    
+    def save(self, settings, profiles, rate):
+        """Сохраняет профили (шаблоны — у обученных). Возвращает число записанных байт."""
+        try:
+            mm, previous = self._open()
+        except (OSError, ValueError):
+            mm, previous = None, None
+        known = previous['blobs'] if previous else {}
+        kept, fresh = {}, {}
+        
+        def put(values):
+            values = np.ascontiguousarray(values)
+            digest = hashlib.sha1(f"{values.dtype.str}{values.shape}".encode() + values.tobytes()).hexdigest()
+            if digest in known:
+                kept[digest] = known[digest]
+            elif digest not in fresh:
+                fresh[digest] = values
+            return digest
+        
+        try:
+            entries = [{'data': p.to_dict(), 'model': self._encode(p.sound_model, put) if p.is_trained else None}
+                       for p in profiles]
+            live = sum(int(np.prod(ref['shape'])) * np.dtype(ref['dtype']).itemsize for ref in kept.values())
+            compact = mm is None or len(mm) - self.HEADER_SIZE - live > max(live, self.COMPACT_MIN_BYTES)
+            copies = {digest: self._view(mm, ref).copy() for digest, ref in kept.items()} if compact else {}
+        finally:
+            if mm is not None:
+                mm.close()
+        index = {'version': self.VERSION, 'params': self.params(rate), 'settings': dict(settings),
+                 'blobs': {}, 'profiles': entries}
+        if compact:
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            written = self._write(tmp, index, {**copies, **fresh}, True)
+            try:
+                os.replace(tmp, self.path)
+                return written
+            except OSError:
+                os.remove(tmp)
+                if previous is None:
+                    raise
+                index['blobs'] = {}
+        index['blobs'].update(kept)
+        return self._write(self.path, index, fresh, False)
+    
+    def _write(self, path, index, fresh, new):
+        with open(path, 'wb' if new else 'r+b') as f:
+            if new:
+                f.write(bytes(self.HEADER_SIZE))
+            start = f.seek(0, os.SEEK_END)
+            for digest, values in fresh.items():
+                f.write(bytes(-f.tell() % self.ALIGN))
+                index['blobs'][digest] = {'offset': f.tell(), 'shape': list(values.shape), 'dtype': values.dtype.str}
+                f.write(values.tobytes())
+            raw = json.dumps(index, ensure_ascii=False).encode('utf-8')
+            offset = f.tell()
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, offset, len(raw), zlib.crc32(raw)))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.seek(0, os.SEEK_END) - start
+
+class BackgroundModel:
+    """Модель фона: уровень шума и дистанции окон-кандидатов.
+
+    Пол шума — низкий перцентиль RMS блоков за последние FLOOR_SECONDS; порог
+    громкости профиля поднимается до пола × FLOOR_RATIO, поэтому в громкие
+    периоды окна фона отсекаются ещё до DTW. Точные дистанции всех окон,
+    дошедших до DTW, включая сработавшие (ранее отсечение для них идёт по
+    порогу профиля, поэтому всё, что ниже него, измерено точно), сливаются в
+    события так же, как срабатывания сливает пауза профиля: событие —
+    минимальная дистанция окон за cooldown от его первого окна. События
+    копятся за HORIZON секунд.
+
+    После MIN_SPAN секунд наблюдения эффективный порог — дробная порядковая
+    статистика минимумов событий с рангом target_rate × горизонт / 3600:
+    при целом ранге k ниже порога оказываются ровно k событий, между целыми
+    рангами порог интерполируется. Настоящие срабатывания тоже события, так
+    что целевая частота должна быть выше ожидаемой частоты нужного звука.
+    Порог профиля остаётся верхней границей, нижняя — MIN_SCALE от него.
+    """
+    FLOOR_SECONDS = 10.0
+    FLOOR_PERCENTILE = 10
+    FLOOR_RATIO = 2.0
+    HORIZON = 3600.0
+    MIN_SPAN = 60.0
+    UPDATE_INTERVAL = 5.0
+    MIN_SCALE = 0.5
+    
+    def __init__(self, block_seconds, target_rate=1.0):
+        self.levels = np.zeros(max(1, int(round(self.FLOOR_SECONDS / block_seconds))))
+        self.target_rate = target_rate
+        self.reset()
+    
+    def reset(self):
+        self.level_count = 0
+        self.floor = 0.0
+        self.events = {}
+        self.since = {}
+        self.scales = {}
+        self.last_update = None
+    
+    def observe_block(self, samples):
+        self.levels[self.level_count % len(self.levels)] = np.sqrt(np.dot(samples, samples) / max(len(samples), 1))
+        self.level_count += 1
+        filled = self.levels[:min(self.level_count, len(self.levels))]
+        self.floor = float(np.percentile(filled, self.FLOOR_PERCENTILE))
+    
+    def volume_gate(self, min_volume):
+        return max(min_volume, self.floor * self.FLOOR_RATIO)
+    
+    def observe(self, config_id, distance, threshold, cooldown, current_time):
+        """Точная дистанция окна (в долях порога профиля; inf — выше порога)."""
+        if threshold <= 0:
+            return
+        value = min(distance / threshold, 1.0)
+        events = self.events.setdefault(config_id, deque())
+        if events and current_time - events[-1][0] < cooldown:
+            events[-1][1] = min(events[-1][1], value)
+        else:
+            events.append([current_time, value])
+        self.since.setdefault(config_id, current_time)
+        if self.last_update is None:
+            self.last_update = current_time
+        elif current_time - self.last_update >= self.UPDATE_INTERVAL:
+            self.update(current_time)
+    
+    def update(self, current_time):
+        self.last_update = current_time
+        scales = {}
+        for config_id, events in self.events.items():
+            while events and current_time - events[0][0] > self.HORIZON:
+                events.popleft()
+            span = min(current_time - self.since[config_id], self.HORIZON)
+            if span < self.MIN_SPAN:
+                continue
+            rank = self.target_rate * span / 3600.0
+            minima = np.sort(np.fromiter((v for _, v in events), dtype=np.float64, count=len(events)))
+            minima = np.append(minima, [1.0, 1.0])
+            k = min(int(rank), len(minima) - 2)
+            scale = minima[k] + (rank - k) * (minima[k + 1] - minima[k])
+            scales[config_id] = float(np.clip(scale, self.MIN_SCALE, 1.0))
+        self.scales = scales
+    
+    def threshold(self, config_id, threshold):
+        return threshold * self.scales.get(config_id, 1.0)
+
+class StageTimers:
+    """Скользящие окна длительностей этапов анализа (последние WINDOW замеров).
+
+    add() — одна запись в кольцевой массив; перцентили считаются только
+    при snapshot(), то есть раз в опрос статистики, а не на каждом чанке.
+    """
+    STAGES = ('capture_wait', 'buffer', 'features', 'dtw', 'dtw_profile', 'dispatch', 'block')
+    WINDOW = 512
+    
+    def __init__(self, block_seconds):
+        self.block_seconds = block_seconds
+        self.samples = {stage: np.zeros(self.WINDOW) for stage in self.STAGES}
+        self.counts = dict.fromkeys(self.STAGES, 0)
+        self.depths = np.zeros(self.WINDOW, dtype=np.int32)
+        self.depth_count = 0
+    
+    def add(self, stage, seconds):
+        self.samples[stage][self.counts[stage] % self.WINDOW] = seconds
+        self.counts[stage] += 1
+    
+    def add_depth(self, depth):
+        self.depths[self.depth_count % self.WINDOW] = depth
+        self.depth_count += 1
+    
+    def recent(self, stage):
+        return self.samples[stage][:min(self.counts[stage], self.WINDOW)]
+    
+    def snapshot(self):
+        stages = {}
+        for stage in self.STAGES:
+            values = self.recent(stage)
+            if not len(values):
+                continue
+            p50, p99 = np.percentile(values, [50, 99]) * 1e3
+            stages[stage] = {'count': self.counts[stage], 'p50_ms': round(float(p50), 3),
+                             'p99_ms': round(float(p99), 3), 'max_ms': round(float(values.max() * 1e3), 3)}
+        block = self.recent('block')
+        depths = self.depths[:min(self.depth_count, self.WINDOW)]
+        return {
+            'realtime_factor': round(float(block.mean() / self.block_seconds), 4) if len(block) else None,
+            'queue_depth': {'last': int(self.depths[(self.depth_count - 1) % self.WINDOW]) if len(depths) else 0,
+                            'max': int(depths.max()) if len(depths) else 0},
+            'stages': stages
+        }
+    
+    def reset(self):
+        for stage in self.STAGES:
+            self.counts[stage] = 0
+        self.depth_count = 0
+
+class CaptureHub:
+    """Один входной поток на всё приложение с раздачей блоков подписчикам.
+
+    Устройство открывается при первой подписке и остаётся открытым до close(),
+    поэтому тест и запись начинаются сразу и не мешают прослушиванию. Колбэк
+    PyAudio передаёт каждому подписчику один и тот же неизменяемый bytes-блок
+    (без копий); подписчики вызываются в потоке PortAudio и должны только
+    положить блок в очередь или обновить счётчик.
+    """
+    TIMEOUT = 2.0
+    
+    def __init__(self, rate, channels, chunk):
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.subscribers = ()
+        self.lock = threading.Lock()
+        self.audio = None
+        self.stream = None
+    
+    def subscribe(self, callback):
+        """callback(data, status) получает каждый захваченный блок."""
+        with self.lock:
+            if self.stream is None:
+                self._open()
+            self.subscribers = self.subscribers + (callback,)
+        return callback
+    
+    def unsubscribe(self, callback):
+        with self.lock:
+            self.subscribers = tuple(s for s in self.subscribers if s != callback)
+    
+    def record(self, seconds):
+        """Следующие seconds секунд захвата одним bytes-блоком (блокирует вызывающий поток)."""
+        blocks = queue.Queue()
+        callback = self.subscribe(lambda data, status: blocks.put(data))
+        try:
+            return b''.join(blocks.get(timeout=self.TIMEOUT)
+                            for _ in range(int(self.rate / self.chunk * seconds)))
+        finally:
+            self.unsubscribe(callback)
+    
+    def _open(self):
+        if pyaudio is None:
+            raise RuntimeError("PyAudio не установлен")
+        audio = pyaudio.PyAudio()
+        try:
+            self.stream = audio.open(format=pyaudio.paInt16,
+                                     channels=self.channels,
+                                     rate=self.rate,
+                                     input=True,
+                                     frames_per_buffer=self.chunk,
+                                     stream_callback=self._callback)
+            self.stream.start_stream()
+        except Exception:
+            audio.terminate()
+            self.stream = None
+            raise
+        self.audio = audio
+    
+    def _callback(self, in_data, frame_count, time_info, status):
+        for subscriber in self.subscribers:
+            subscriber(in_data, status)
+        return (None, pyaudio.paContinue)
+    
+    def close(self):
+        with self.lock:
+            self.subscribers = ()
+            stream, audio = self.stream, self.audio
+            self.stream = self.audio = None
+        try:
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
+            if audio is not None:
+                audio.terminate()
+        except Exception:
+            pass
+
+class DetectionEngine:
+    """Захват → признаки → сопоставление → срабатывание, без зависимости от Tk.
+
+    Профили (Profile) лежат в self.configs; GUI показывает их через ProfileList.
+    Подклассы переопределяют on_trigger, on_audio_error и on_stopped.
+    """
+    MATCH_MODES = {
+        'window': "Окно 1 с",
+        'subsequence': "Поиск в потоке",
+        'onset': "По событию"
+    }
+    MATCH_BACKENDS = {
+        'thread': "Один процесс",
+        'process': "Все ядра"
+    }
+    
+    def __init__(self, config_file=None):
+        self.CHUNK = 1024
+        self.CHANNELS = 1
+        self.RATE = 16000
+        self.BUFFER_DURATION = 1.0
+        self.BUFFER_SIZE = int(self.RATE / self.CHUNK * self.BUFFER_DURATION)
+        self.CAPTURE_QUEUE_SIZE = 32
+        self.MAX_BACKLOG = 2
+        self.REFINE_MARGIN = 1.5
+        
+        self.is_listening = False
+        self.configs = []
+        self.trigger_count = 0
+        self.dropped_chunks = 0
+        self.overrun_chunks = 0
+        self.skipped_windows = 0
+        self.capture_queue = queue.Queue(maxsize=self.CAPTURE_QUEUE_SIZE)
+        self.capture = CaptureHub(self.RATE, self.CHANNELS, self.CHUNK)
+        self.bank = TemplateBank()
+        self.prototypes = {}
+        self.examples = {}
+        self.refined_windows = 0
+        self.subsequence = SubsequenceMatcher()
+        self.cascade = CascadeFilter()
+        self.background = BackgroundModel(self.CHUNK / self.RATE)
+        self.pending_windows = []
+        self.pool = None
+        self.bank_dirty = True
+        self.early_abandon = True
+        self.timers = StageTimers(self.CHUNK / self.RATE)
+        self.actions = ActionDispatcher(self.timers, self.on_action_result)
+        self.block_captured = 0.0
+        self.settings = {
+            'match_mode': 'window',
+            'match_backend': 'thread',
+            'adaptive': True,
+            'false_triggers_per_hour': 1.0,
+            'bundle': ''
+        }
+        self.config_file = Path(config_file) if config_file else Path.home() / ".sonictrigger_config.json"
+        self.template_cache = TemplateCache(self.config_file.parent / ".sonictrigger_cache", self.RATE)
+    
+    def apply_settings(self, settings):
+        self.settings.update({k: v for k, v in settings.items() if k in self.settings})
+        if self.settings['match_mode'] not in self.MATCH_MODES:
+            self.settings['match_mode'] = 'window'
+        if self.settings['match_backend'] not in self.MATCH_BACKENDS:
+            self.settings['match_backend'] = 'thread'
+        self.background.target_rate = float(self.settings['false_triggers_per_hour'])
+        self.bank_dirty = True
+        self.subsequence.reset()
+    
+    def attach_bundle(self, profiles):
+        """Шаблоны из пакета settings['bundle'] (по id профиля) для профилей,
+        чьих звуков на этой машине нет."""
+        if not self.settings['bundle']:
+            return
+        try:
+            _, bundled = ProfileBundle(self.settings['bundle']).read(self.RATE)
+        except Exception as e:
+            print(f"Bundle error: {e}")
+            return
+        models = {profile.config_id: profile.sound_model for profile in bundled if profile.is_trained}
+        for profile in profiles:
+            paths = profile_paths(profile.data)
+            if profile.config_id in models and not (paths and all(os.path.exists(p) for p in paths)):
+                profile.apply_model(models[profile.config_id])
+    
+    def now(self):
+        return time.time()
+    
+    def on_trigger(self, config, distance):
+        pass
+    
+    def on_action_result(self, config, error):
+        pass
+    
+    def dispatch_action(self, config):
+        """Запуск приложения профиля; задержка считается от захвата последнего блока окна."""
+        self.actions.submit(config, self.block_captured)
+    
+    def performance(self):
+        snapshot = self.timers.snapshot()
+        snapshot.update({
+            'time': time.time(),
+            'profiles': len(self.prototypes),
+            'templates': len(self.bank),
+            'mode': self.settings['match_mode'],
+            'triggers': self.trigger_count,
+            'dropped_chunks': self.dropped_chunks,
+            'overrun_chunks': self.overrun_chunks,
+            'skipped_windows': self.skipped_windows,
+            'cascade_rejected': dict(self.cascade.rejected),
+            'dtw_runs': self.cascade.dtw_runs,
+            'dtw_pruning': dict(self.cascade.pruning),
+            'refined_windows': self.refined_windows,
+            'actions': self.actions.snapshot(),
+            'background': {
+                'noise_floor': self.background.floor,
+                'threshold_scales': dict(self.background.scales)
+            }
+        })
+        return snapshot
+    
+    def dump_performance(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.performance(), f, indent=2)
+        os.replace(tmp, path)
+    
+    def on_distances(self, distances, current_time):
+        pass
+    
+    def on_audio_error(self, error):
+        print(f"Audio error: {error}")
+    
+    def on_stopped(self):
+        pass
+    
+    def on_audio_block(self, in_data, status):
+        if status & pyaudio.paInputOverflow:
+            self.overrun_chunks += 1
+        try:
+            self.capture_queue.put_nowait((in_data, time.perf_counter()))
+        except queue.Full:
+            self.dropped_chunks += 1
+    
+    def reset_analysis(self):
+        self.window_samples = self.CHUNK * self.BUFFER_SIZE
+        self.ring = AudioRingBuffer(2 * self.window_samples)
+        self.feature_stream = StreamingFeatureExtractor(self.RATE, self.CHUNK, self.window_samples, self.ring)
+        self.onsets = OnsetDetector(self.RATE)
+        self.active_mode = self.settings['match_mode']
+        self.pending_windows = []
+        self.background.reset()
+    
+    def analyze_block(self, samples, backlog=0, captured=None):
+        started = time.perf_counter()
+        self.block_captured = started if captured is None else captured
+        self.timers.add_depth(backlog)
+        try:
+            self._analyze_block(samples, backlog)
+        finally:
+            self.timers.add('block', time.perf_counter() - started)
+    
+    def _analyze_block(self, samples, backlog):
+        if self.settings['match_mode'] != self.active_mode:
+            self.active_mode = self.settings['match_mode']
+            self.feature_stream.reset()
+            self.onsets.reset()
+            self.pending_windows = []
+        started = time.perf_counter()
+        if self.active_mode == 'onset':
+            self.ring.write(samples)
+            self.background.observe_block(self.ring.latest(len(samples)))
+            self.timers.add('buffer', time.perf_counter() - started)
+            self.process_onsets(self.ring, self.onsets, samples, self.window_samples)
+            return
+        self.feature_stream.push(samples)
+        self.background.observe_block(self.ring.latest(len(samples)))
+        self.timers.add('buffer', time.perf_counter() - started)
+        if not self.feature_stream.ready:
+            return
+        if backlog > self.MAX_BACKLOG:
+            self.skipped_windows += 1
+            return
+        self.process_audio(self.ring.latest(self.window_samples), self.feature_stream)
+    
+    def audio_loop(self):
+        try:
+            while not self.capture_queue.empty():
+                self.capture_queue.get_nowait()
+            self.reset_analysis()
+            self.capture.subscribe(self.on_audio_block)
+            while self.is_listening:
+                waited = time.perf_counter()
+                try:
+                    data, captured = self.capture_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                self.timers.add('capture_wait', time.perf_counter() - waited)
+                try:
+                    self.analyze_block(np.frombuffer(data, dtype=np.int16), self.capture_queue.qsize(), captured)
+                except Exception as e:
+                    print(f"Audio error: {e}")
+        except Exception as e:
+            self.on_audio_error(e)
+        finally:
+            self.capture.unsubscribe(self.on_audio_block)
+            self.close_pool()
+            self.bank_dirty = True
+            self.on_stopped()
+    
+    def process_onsets(self, ring, onsets, samples, window_samples):
+        if self.bank_dirty:
+            self.rebuild_bank()
+        configs = [c for c in self.configs
+                   if c.data['enabled'] and c.is_trained and c.config_id in self.prototypes]
+        if configs:
+            min_level = min(self.volume_gate(c) for c in configs)
+            for onset in onsets.process(samples, min_level):
+                groups = {}
+                for config in configs:
+                    offset = int(config.sound_model.get('onset', 0.25) * self.RATE)
+                    offset = min(offset - offset % OnsetDetector.BLOCK, window_samples - OnsetDetector.BLOCK)
+                    groups.setdefault(offset, set()).add(config.config_id)
+                for offset, ids in groups.items():
+                    start = onset - offset
+                    self.pending_windows.append((start + window_samples, start, ids))
+        
+        due = [w for w in self.pending_windows if w[0] <= ring.written]
+        if not due:
+            return
+        self.pending_windows = [w for w in self.pending_windows if w[0] > ring.written]
+        for end, start, ids in due:
+            back = ring.written - start
+            if start < 0 or back > ring.capacity:
+                self.skipped_windows += 1
+                continue
+            self.process_audio(ring.latest(back)[:window_samples], config_ids=ids)
+    
+    def process_audio(self, window, feature_stream=None, config_ids=None):
+        if len(window) == 0:
+            return
+        normalized_volume = float(np.sqrt(np.dot(window, window) / len(window)))
+        current_time = self.now()
+        if self.bank_dirty:
+            self.rebuild_bank()
+        
+        if self.settings['match_mode'] == 'subsequence' and feature_stream is not None:
+            self.process_stream(feature_stream, normalized_volume, current_time)
+            return
+        
+        candidates = self.active_candidates(normalized_volume, current_time, config_ids)
+        if not candidates:
+            return
+        if feature_stream is not None and feature_stream.ready:
+            summary = CascadeFilter.summarize(*feature_stream.frame_stats())
+        else:
+            summary = CascadeFilter.summarize(*frame_stats(window, self.RATE))
+        candidates = [c for c in candidates if self.cascade.check(summary, c.sound_model.get('signature'))]
+        if not candidates:
+            return
+        
+        started = time.perf_counter()
+        if feature_stream is not None and feature_stream.ready:
+            features = feature_stream.features()
+        else:
+            features = self.extract_features(window)
+        self.timers.add('features', time.perf_counter() - started)
+        if features is None:
+            return
+        thresholds = {c.config_id: self.effective_threshold(c) for c in candidates}
+        base = {c.config_id: c.data['threshold'] for c in candidates}
+        started = time.perf_counter()
+        try:
+            limits = {c.config_id: base[c.config_id] * (self.REFINE_MARGIN if self.examples[c.config_id] else 1.0)
+                      for c in candidates}
+            distances = self.match_templates(features, candidates, self.prototypes, limits)
+            refine = [c for c in candidates if self.examples[c.config_id] and
+                      thresholds[c.config_id] <= distances[c.config_id] < base[c.config_id] * self.REFINE_MARGIN]
+            if refine:
+                self.refined_windows += 1
+                refined = self.match_templates(features, refine, self.examples, base)
+                for config_id, distance in refined.items():
+                    distances[config_id] = min(distances[config_id], distance)
+        except Exception as e:
+            print(f"Comparison error: {e}")
+            return
+        elapsed = time.perf_counter() - started
+        self.timers.add('dtw', elapsed)
+        self.timers.add('dtw_profile', elapsed / len(candidates))
+        
+        self.on_distances(distances, current_time)
+        for config in candidates:
+            distance = distances[config.config_id]
+            self.observe_background(config, distance, current_time)
+            if distance < thresholds[config.config_id]:
+                self.register_trigger(config, distance, current_time)
+            else:
+                self.cascade.rejected['dtw'] += 1
+    
+    def match_templates(self, features, candidates, templates, thresholds):
+        """Лучшая дистанция каждого профиля по его шаблонам из templates
+        ({config_id: [ключи банка]}); раннее отсечение — на thresholds."""
+        keys, limits = [], []
+        for config in candidates:
+            keys += templates[config.config_id]
+            limits += [thresholds[config.config_id]] * len(templates[config.config_id])
+        limits = limits if self.early_abandon else None
+        distances = None
+        if self.pool is not None:
+            try:
+                distances = self.pool.match(features, keys, limits, self.cascade.pruning)
+            except Exception as e:
+                print(f"Process pool error: {e}")
+                self.close_pool()
+        if distances is None:
+            distances = self.bank.match(features, keys, limits, self.cascade.pruning)
+        self.cascade.dtw_runs += len(keys)
+        return {c.config_id: min(distances[k] for k in templates[c.config_id]) for c in candidates}
+    
+    def process_stream(self, feature_stream, normalized_volume, current_time):
+        if not feature_stream.ready:
+            return
+        started = time.perf_counter()
+        features = feature_stream.features()
+        self.timers.add('features', time.perf_counter() - started)
+        started = time.perf_counter()
+        try:
+            scores = self.subsequence.step(feature_stream.settled_frames(features))
+        except Exception as e:
+            print(f"Comparison error: {e}")
+            return
+        elapsed = time.perf_counter() - started
+        self.timers.add('dtw', elapsed)
+        self.timers.add('dtw_profile', elapsed / max(len(self.prototypes), 1))
+        scores = {config_id: min(scores[k] for k in keys) for config_id, keys in self.prototypes.items()}
+        self.on_distances(scores, current_time)
+        self.subsequence.reset([key for config in self.configs if config.config_id in self.prototypes
+                                and current_time - config.last_trigger < config.cooldown
+                                for key in self.prototypes[config.config_id]])
+        for config in self.active_candidates(normalized_volume, current_time):
+            distance = scores.get(config.config_id, float('inf'))
+            self.observe_background(config, distance, current_time)
+            if distance < self.effective_threshold(config):
+                self.subsequence.reset(self.prototypes[config.config_id])
+                self.register_trigger(config, distance, current_time)
+    
+    def active_candidates(self, normalized_volume, current_time, config_ids=None):
+        candidates = []
+        for config in self.configs:
+            if config_ids is not None and config.config_id not in config_ids:
+                continue
+            if not (config.data['enabled'] and config.is_trained):
+                continue
+            if config.config_id not in self.prototypes:
+                continue
+            if current_time - config.last_trigger < config.cooldown:
+                continue
+            if normalized_volume < self.volume_gate(config):
+                self.cascade.rejected['volume'] += 1
+                continue
+            candidates.append(config)
+        return candidates
+    
+    def effective_threshold(self, config):
+        if not self.settings['adaptive']:
+            return config.data['threshold']
+        return self.background.threshold(config.config_id, config.data['threshold'])
+    
+    def volume_gate(self, config):
+        if not self.settings['adaptive']:
+            return config.data['min_volume']
+        return self.background.volume_gate(config.data['min_volume'])
+    
+    def observe_background(self, config, distance, current_time):
+        if self.settings['adaptive']:
+            self.background.observe(config.config_id, distance, config.data['threshold'], config.cooldown,
+                                    current_time)
+    
+    def register_trigger(self, config, distance, current_time):
+        config.last_trigger = current_time
+        self.trigger_count += 1
+        self.on_trigger(config, distance)
+    
+    def rebuild_bank(self):
+        self.bank_dirty = False
+        models, self.prototypes, self.examples = {}, {}, {}
+        for config in list(self.configs):
+            if config.data['enabled'] and config.is_trained and config.sound_model is not None:
+                prototypes, examples = model_templates(config.config_id, config.sound_model)
+                models.update(prototypes)
+                models.update(examples)
+                self.prototypes[config.config_id] = list(prototypes)
+                self.examples[config.config_id] = list(examples)
+        self.bank.rebuild(models)
+        self.subsequence.rebuild(self.bank, [k for keys in self.prototypes.values() for k in keys])
+        if self.settings['match_backend'] != 'process' or len(self.bank) <= 1:
+            self.close_pool()
+            return
+        try:
+            if self.pool is None:
+                self.pool = ProcessPoolMatcher(self.bank.band, self.bank.templates.shape[2])
+            self.pool.update(models)
+        except Exception as e:
+            print(f"Process pool error: {e}")
+            self.close_pool()
+    
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+    
+    def extract_features(self, y):
+        try:
+            if len(y) < self.RATE * 0.4:
+                return None
+            return mfcc_features(y, self.RATE)
+        except Exception as e:
+            print(f"Feature extraction error: {e}")
+            return None
+    
+    def match_features(self, features, model, threshold=None):
+        try:
+            max_cost = None if threshold is None else threshold * model['frames']
+            distance = dtw_distance(features, model['mfcc'], max_cost=max_cost)
+            return distance / model['frames']
+        except Exception as e:
+            print(f"Comparison error: {e}")
+            return float('inf')
+    
+    def compare_audio(self, y, model):
+        features = self.extract_features(y)
+        if features is None:
+            return float('inf')
+        prototypes, examples = model_templates(None, model)
+        return min(self.match_features(features, t) for t in [*prototypes.values(), *examples.values()])
@@ -0,0 +1,156 @@
+"""SonicTrigger без интерфейса: тот же движок, профили из ~/.sonictrigger_config.json.
+
+    py headless.py [--config путь | --bundle файл.stbundle] [--mode window|subsequence|onset]
+                   [--backend thread|process] [--stats секунды] [--stats-json файл]
+    py headless.py --export файл.stbundle   # обучить профили конфигурации и упаковать с шаблонами
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from engine import DetectionEngine, Profile, ProfileBundle, read_config, profile_paths, _train_worker
+
+
+class HeadlessTrigger(DetectionEngine):
+    def __init__(self, config_file=None):
+        super().__init__(config_file)
+        self.audio_failed = False
+
+    def log(self, message):
+        print(f"[{datetime.now():%H:%M:%S}] {message}", flush=True)
+
+    def load_profiles(self, bundle=None):
+        if bundle:
+            settings, self.configs = ProfileBundle(bundle).read(self.RATE)
+        else:
+            settings, profiles = read_config(self.config_file)
+            self.configs = [Profile(data) for data in profiles]
+        self.apply_settings(settings)
+        if not bundle:
+            self.attach_bundle(self.configs)
+        for profile in self.configs:
+            if profile.action_error is not None and profile.data['enabled']:
+                self.log(f"Профиль '{profile.data['name']}': {profile.action_error}")
+
+    def train_profiles(self):
+        """Шаблоны из пакета и кэша читаются на месте; промахи обучаются во временном
+        пуле, чтобы librosa не оставалась в памяти службы."""
+        missing = []
+        for profile in self.configs:
+            paths = profile_paths(profile.data)
+            if profile.is_trained or not profile.data['enabled'] or not profile.data['sound_path'] \
+                    or not all(os.path.exists(p) for p in paths):
+                continue
+            model = self.template_cache.load_profile(paths)
+            if model is None:
+                missing.append(profile)
+            else:
+                profile.apply_model(model)
+        if missing:
+            cache = self.template_cache
+            with ProcessPoolExecutor() as executor:
+                futures = [(profile, executor.submit(_train_worker, profile_paths(profile.data),
+                                                     cache.directory, cache.rate))
+                           for profile in missing]
+                for profile, future in futures:
+                    try:
+                        profile.apply_model(future.result())
+                    except Exception as e:
+                        profile.apply_model(None, e)
+                        self.log(f"Профиль '{profile.data['name']}' не обучен: {e}")
+        self.bank_dirty = True
+        return [p for p in self.configs if p.is_trained and p.data['enabled']]
+
+    def on_trigger(self, config, distance):
+        self.log(f"Сработал '{config.data['name']}' (дистанция {distance:.2f})")
+        self.dispatch_action(config)
+
+    def on_action_result(self, config, error):
+        if error is not None:
+            self.log(f"Не удалось запустить приложение '{config.data['name']}': {error}")
+
+    def on_audio_error(self, error):
+        self.log(f"Ошибка аудио: {error}")
+        self.audio_failed = True
+        self.is_listening = False
+
+    def stats_line(self):
+        rejected = self.cascade.rejected
+        snapshot = self.timers.snapshot()
+        rtf = "—" if snapshot['realtime_factor'] is None else f"{snapshot['realtime_factor']:.3f}"
+        floor = f"{self.background.floor:.4f}" if self.settings['adaptive'] else "—"
+        return (f"RTF {rtf} · очередь макс. {snapshot['queue_depth']['max']} · фон {floor} · "
+                f"срабатываний {self.trigger_count} · потери {self.dropped_chunks + self.overrun_chunks} · "
+                f"пропуски {self.skipped_windows} · DTW запусков {self.cascade.dtw_runs} "
+                f"(LB отсеял {self.cascade.pruning['lower_bound']}, прервано {self.cascade.pruning['abandoned']}), "
+                f"отсеяно до DTW {sum(v for k, v in rejected.items() if k != 'dtw')}")
+
+    def run(self, stats_interval=0, stats_json=None):
+        def stop(signum, frame):
+            self.is_listening = False
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        self.is_listening = True
+        worker = threading.Thread(target=self.audio_loop, daemon=True)
+        worker.start()
+        last_stats = time.time()
+        while worker.is_alive():
+            worker.join(timeout=0.5)
+            if stats_interval and time.time() - last_stats >= stats_interval:
+                last_stats = time.time()
+                self.log(self.stats_line())
+                if stats_json:
+                    try:
+                        self.dump_performance(stats_json)
+                    except Exception as e:
+                        print(f"Stats dump error: {e}")
+        self.capture.close()
+        self.actions.close()
+        self.log(f"Остановлено: {self.stats_line()}")
+        return 1 if self.audio_failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SonicTrigger без графического интерфейса")
+    parser.add_argument('--config', help="файл конфигурации (по умолчанию ~/.sonictrigger_config.json)")
+    parser.add_argument('--bundle', help="пакет профилей с готовыми шаблонами (.stbundle) вместо конфигурации")
+    parser.add_argument('--export', metavar="ФАЙЛ", help="обучить профили, сохранить их пакетом и выйти")
+    parser.add_argument('--mode', choices=sorted(DetectionEngine.MATCH_MODES), help="режим сопоставления")
+    parser.add_argument('--backend', choices=sorted(DetectionEngine.MATCH_BACKENDS), help="вычисление DTW")
+    parser.add_argument('--stats', type=float, default=0, help="печатать статистику каждые N секунд")
+    parser.add_argument('--stats-json', help="с тем же интервалом записывать замеры этапов в JSON")
+    args = parser.parse_args()
+
+    service = HeadlessTrigger(args.config)
+    try:
+        service.load_profiles(args.bundle)
+    except Exception as e:
+        print(f"Config error: {e}")
+        return 2
+    overrides = {'match_mode': args.mode, 'match_backend': args.backend}
+    service.apply_settings({k: v for k, v in overrides.items() if v})
+    active = service.train_profiles()
+    if args.export:
+        try:
+            written = ProfileBundle(args.export).save(service.settings, service.configs, service.RATE)
+        except Exception as e:
+            print(f"Export error: {e}")
+            return 2
+        service.log(f"Пакет {args.export}: профилей {len(service.configs)}, обучено {len(active)}, "
+                    f"записано {written / 1024:.0f} КБ")
+        return 0
+    if not active:
+        print("Нет обученных и включённых профилей.")
+        return 2
+    service.log(f"Профилей: {len(active)}, режим: {service.MATCH_MODES[service.settings['match_mode']]}, "
+                f"вычисление: {service.MATCH_BACKENDS[service.settings['match_backend']]}")
+    return service.run(args.stats, args.stats_json)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
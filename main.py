@@ -1,53 +1,41 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pyaudio
 import wave
 import numpy as np
-import librosa
 import os
-import json
 import time
 import uuid
-from pathlib import Path
-import subprocess
-from scipy.spatial.distance import euclidean
-from fastdtw import fastdtw
+import importlib.util
 import warnings
 from datetime import datetime
+from engine import DetectionEngine, Profile, ProfileBundle, read_config, write_config, profile_paths, _train_worker
 warnings.filterwarnings("ignore")
 
 class ConfigPanel(ttk.Frame):
-    def __init__(self, parent, app, config_id=None):
+    """Строка списка профилей. Своих данных не хранит: показывает и правит
+    привязанный Profile, при прокрутке перепривязывается к другому."""
+    
+    def __init__(self, parent, app):
         super().__init__(parent, style="Config.TFrame")
         self.app = app
-        self.config_id = config_id or str(uuid.uuid4())
-        self.sound_model = None
-        self.last_trigger = 0
-        self.is_trained = False
-        self.cooldown = 1.2
-        self.data = {
-            'name': f"Триггер {len(app.configs) + 1}",
-            'sound_path': '',
-            'exe_path': '',
-            'threshold': 2.5,
-            'min_volume': 0.008,
-            'enabled': True
-        }
+        self.profile = None
         self.create_widgets()
-        self.update_appearance()
     
     def create_widgets(self):
         header = ttk.Frame(self, style="ConfigHeader.TFrame")
         header.pack(fill='x', padx=8, pady=(8, 4))
         
-        self.name_var = tk.StringVar(value=self.data['name'])
+        self.name_var = tk.StringVar()
         name_entry = ttk.Entry(header, textvariable=self.name_var, width=20,
                              style="ConfigName.TEntry", font=('Segoe UI', 10, 'bold'))
         name_entry.pack(side='left', padx=(4, 8))
         name_entry.bind('<FocusOut>', self.on_name_change)
         
-        self.enabled_var = tk.BooleanVar(value=self.data['enabled'])
+        self.enabled_var = tk.BooleanVar()
         enable_btn = ttk.Checkbutton(header, variable=self.enabled_var,
                                    text="Активен", style="ConfigToggle.TCheckbutton",
                                    command=self.on_toggle)
@@ -70,7 +58,7 @@ class ConfigPanel(ttk.Frame):
         ttk.Label(sound_frame, text="🔊 Звук-триггер", style="ConfigSectionLabel.TLabel").pack(anchor='w')
         path_frame = ttk.Frame(sound_frame, style="ConfigSection.TFrame")
         path_frame.pack(fill='x', pady=(4, 0))
-        self.sound_path_var = tk.StringVar(value=self.data['sound_path'])
+        self.sound_path_var = tk.StringVar()
         path_entry = ttk.Entry(path_frame, textvariable=self.sound_path_var,
                              state='readonly', style="ConfigPath.TEntry")
         path_entry.pack(side='left', fill='x', expand=True, padx=(0, 6))
@@ -78,13 +66,17 @@ class ConfigPanel(ttk.Frame):
                  command=self.browse_sound, width=8).pack(side='left')
         ttk.Button(path_frame, text="Запись", style="ConfigRecord.TButton",
                  command=self.record_sound, width=8).pack(side='left', padx=(4, 0))
+        ttk.Button(path_frame, text="＋", style="ConfigButton.TButton",
+                 command=self.add_examples, width=3).pack(side='left', padx=(4, 0))
+        self.examples_label = ttk.Label(sound_frame, style="ConfigHint.TLabel")
+        self.examples_label.pack(anchor='w')
         
         exe_frame = ttk.Frame(content, style="ConfigSection.TFrame")
         exe_frame.pack(fill='x', pady=4)
         ttk.Label(exe_frame, text="🚀 Приложение", style="ConfigSectionLabel.TLabel").pack(anchor='w')
         exe_path_frame = ttk.Frame(exe_frame, style="ConfigSection.TFrame")
         exe_path_frame.pack(fill='x', pady=(4, 0))
-        self.exe_path_var = tk.StringVar(value=self.data['exe_path'])
+        self.exe_path_var = tk.StringVar()
         exe_entry = ttk.Entry(exe_path_frame, textvariable=self.exe_path_var,
                             state='readonly', style="ConfigPath.TEntry")
         exe_entry.pack(side='left', fill='x', expand=True, padx=(0, 6))
@@ -97,9 +89,8 @@ class ConfigPanel(ttk.Frame):
         thresh_frame = ttk.Frame(sens_frame, style="ConfigSection.TFrame")
         thresh_frame.pack(fill='x', pady=2)
         ttk.Label(thresh_frame, text="Чувствительность", style="ConfigSliderLabel.TLabel").pack(side='left')
-        self.thresh_var = tk.DoubleVar(value=self.data['threshold'])
-        self.thresh_label = ttk.Label(thresh_frame, text=f"{self.thresh_var.get():.1f}",
-                                    style="ConfigSliderValue.TLabel")
+        self.thresh_var = tk.DoubleVar()
+        self.thresh_label = ttk.Label(thresh_frame, style="ConfigSliderValue.TLabel")
         self.thresh_label.pack(side='right')
         thresh_slider = ttk.Scale(thresh_frame, from_=50, to=500,
                                 variable=self.thresh_var, orient='horizontal',
@@ -111,89 +102,137 @@ class ConfigPanel(ttk.Frame):
         vol_frame = ttk.Frame(sens_frame, style="ConfigSection.TFrame")
         vol_frame.pack(fill='x', pady=4)
         ttk.Label(vol_frame, text="Мин. громкость", style="ConfigSliderLabel.TLabel").pack(side='left')
-        self.vol_var = tk.DoubleVar(value=self.data['min_volume'])
-        self.vol_label = ttk.Label(vol_frame, text=f"{self.vol_var.get():.3f}",
-                                 style="ConfigSliderValue.TLabel")
+        self.vol_var = tk.DoubleVar()
+        self.vol_label = ttk.Label(vol_frame, style="ConfigSliderValue.TLabel")
         self.vol_label.pack(side='right')
         vol_slider = ttk.Scale(vol_frame, from_=0.001, to=0.1,
                              variable=self.vol_var, orient='horizontal',
                              command=self.on_vol_change, style="ConfigSlider.Horizontal.TScale")
         vol_slider.pack(fill='x', pady=(2, 0), padx=(5, 0))
+        self.effective_label = ttk.Label(sens_frame, style="ConfigHint.TLabel")
+        self.effective_label.pack(anchor='w', padx=5)
         
         self.status_label = ttk.Label(content, text="⬤ Модель не обучена",
                                     style="ConfigStatusInactive.TLabel")
         self.status_label.pack(anchor='w', pady=(6, 0))
     
+    def bind_profile(self, profile):
+        if self.profile is not None:
+            self.on_name_change()
+        self.profile = profile
+        if profile is None:
+            return
+        data = profile.data
+        self.name_var.set(data['name'])
+        self.enabled_var.set(data['enabled'])
+        self.sound_path_var.set(data['sound_path'])
+        self.exe_path_var.set(data['exe_path'])
+        self.thresh_var.set(round(data['threshold'], 1))
+        self.thresh_label.config(text=f"{data['threshold']:.1f}")
+        self.vol_var.set(round(data['min_volume'], 3))
+        self.vol_label.config(text=f"{data['min_volume']:.3f}")
+        self.effective_label.config(text="")
+        self.update_examples_label()
+        self.update_appearance()
+    
     def update_appearance(self):
-        if self.is_trained and self.enabled_var.get():
-            self.status_label.configure(text="⬤ Готов", style="ConfigStatusActive.TLabel")
+        profile = self.profile
+        if profile.is_trained and profile.data['enabled']:
             self.configure(style="ConfigActive.TFrame")
-        elif not self.enabled_var.get():
-            self.status_label.configure(text="⬤ Отключён", style="ConfigStatusDisabled.TLabel")
+        elif not profile.data['enabled']:
             self.configure(style="ConfigDisabled.TFrame")
         else:
-            self.status_label.configure(text="⬤ Модель не обучена", style="ConfigStatusInactive.TLabel")
             self.configure(style="Config.TFrame")
+        text, style = self.app.profile_list.status_of(profile)
+        self.status_label.configure(text=text, style=style)
     
     def on_name_change(self, event=None):
-        self.data['name'] = self.name_var.get()
+        if self.profile is not None:
+            self.profile.data['name'] = self.name_var.get()
     
     def on_toggle(self):
-        self.data['enabled'] = self.enabled_var.get()
-        self.update_appearance()
+        self.profile.data['enabled'] = self.enabled_var.get()
+        self.app.bank_dirty = True
+        self.app.profile_list.update_appearance(self.profile)
     
     def on_thresh_change(self, value):
         val = float(value)
         self.thresh_var.set(round(val, 1))
         self.thresh_label.config(text=f"{val:.1f}")
-        self.data['threshold'] = val
+        self.profile.data['threshold'] = val
     
     def on_vol_change(self, value):
         val = float(value)
         self.vol_var.set(round(val, 3))
         self.vol_label.config(text=f"{val:.3f}")
-        self.data['min_volume'] = val
+        self.profile.data['min_volume'] = val
+    
+    def show_effective(self, threshold, min_volume):
+        if min_volume is None:
+            self.effective_label.config(text="")
+        else:
+            self.effective_label.config(text=f"С учётом фона: порог {threshold:.1f} · громкость {min_volume:.3f}")
     
     def browse_sound(self):
         filetypes = [("Аудиофайлы", "*.wav *.mp3 *.ogg *.flac"), ("Все файлы", "*.*")]
         path = filedialog.askopenfilename(filetypes=filetypes, title="Выберите звук-триггер")
         if path:
-            self.sound_path_var.set(path)
-            self.data['sound_path'] = path
-            self.train_model()
+            self.app.set_sound(self.profile, path)
+    
+    def add_examples(self):
+        filetypes = [("Аудиофайлы", "*.wav *.mp3 *.ogg *.flac"), ("Все файлы", "*.*")]
+        paths = filedialog.askopenfilenames(filetypes=filetypes, title="Дополнительные примеры звука")
+        if paths:
+            known = set(profile_paths(self.profile.data))
+            self.profile.data['extra_sounds'] += [p for p in paths if p not in known]
+            self.update_examples_label()
+            self.app.train_profile(self.profile)
+    
+    def update_examples_label(self):
+        count = len(self.profile.data['extra_sounds'])
+        self.examples_label.config(text=f"+ примеров: {count}" if count else "")
     
     def browse_exe(self):
         filetypes = [("Приложения", "*.exe"), ("Все файлы", "*.*")]
         path = filedialog.askopenfilename(filetypes=filetypes, title="Выберите приложение")
         if path:
             self.exe_path_var.set(path)
-            self.data['exe_path'] = path
+            self.profile.data['exe_path'] = path
+            self.app.resolve_action(self.profile)
     
     def edit_paths(self):
+        profile = self.profile
         dialog = tk.Toplevel(self.app.root)
-        dialog.title(f"Редактировать пути - {self.data['name']}")
-        dialog.geometry("500x200")
+        dialog.title(f"Редактировать пути - {profile.data['name']}")
+        dialog.geometry("500x330")
         dialog.transient(self.app.root)
         dialog.grab_set()
         dialog.configure(bg='#1e1e1e')
         
         ttk.Label(dialog, text="Путь к звуку-триггеру:").pack(anchor='w', padx=15, pady=(15, 0))
         sound_entry = ttk.Entry(dialog, width=60)
-        sound_entry.insert(0, self.data['sound_path'])
+        sound_entry.insert(0, profile.data['sound_path'])
         sound_entry.pack(padx=15, pady=5, fill='x')
         
+        ttk.Label(dialog, text="Дополнительные примеры (по одному пути в строке):").pack(anchor='w', padx=15, pady=(10, 0))
+        extra_text = scrolledtext.ScrolledText(dialog, height=5, bg='#2d2d2d', fg='#ffffff',
+                                               insertbackground='#ffffff', font=('Consolas', 9))
+        extra_text.insert('1.0', "\n".join(profile.data['extra_sounds']))
+        extra_text.pack(padx=15, pady=5, fill='x')
+        
         ttk.Label(dialog, text="Путь к приложению:").pack(anchor='w', padx=15, pady=(10, 0))
         exe_entry = ttk.Entry(dialog, width=60)
-        exe_entry.insert(0, self.data['exe_path'])
+        exe_entry.insert(0, profile.data['exe_path'])
         exe_entry.pack(padx=15, pady=5, fill='x')
         
         def save():
-            self.data['sound_path'] = sound_entry.get()
-            self.data['exe_path'] = exe_entry.get()
-            self.sound_path_var.set(self.data['sound_path'])
-            self.exe_path_var.set(self.data['exe_path'])
-            if self.data['sound_path']:
-                self.train_model()
+            profile.data['sound_path'] = sound_entry.get()
+            profile.data['exe_path'] = exe_entry.get()
+            profile.data['extra_sounds'] = [p.strip() for p in extra_text.get('1.0', 'end').splitlines() if p.strip()]
+            self.app.profile_list.refresh(profile)
+            self.app.resolve_action(profile)
+            if profile.data['sound_path']:
+                self.app.train_profile(profile)
             dialog.destroy()
         
         btn_frame = ttk.Frame(dialog, style="TFrame")
@@ -202,102 +241,303 @@ class ConfigPanel(ttk.Frame):
         ttk.Button(btn_frame, text="Отмена", command=dialog.destroy).pack(side='right', padx=5)
     
     def record_sound(self):
-        self.app.record_sound_for_config(self)
-    
-    def train_model(self):
-        path = self.data['sound_path']
-        if not path or not os.path.exists(path):
-            self.status_label.configure(text="⬤ Файл не выбран", style="ConfigStatusError.TLabel")
-            self.is_trained = False
-            self.update_appearance()
-            return
-        
-        try:
-            self.status_label.configure(text="⬤ Обучение...", style="ConfigStatusBusy.TLabel")
-            self.app.root.update()
-            y, sr = librosa.load(path, sr=self.app.RATE)
-            if len(y) < self.app.RATE * 0.3:
-                raise ValueError("Звук слишком короткий (мин. 0.3с)")
-            
-            y = librosa.util.normalize(y)
-            mfcc = librosa.feature.mfcc(
-                y=y, sr=sr, n_mfcc=13, n_fft=512, hop_length=256
-            )
-            mfcc_delta = librosa.feature.delta(mfcc)
-            mfcc_delta2 = librosa.feature.delta(mfcc, order=2)
-            features = np.vstack([mfcc, mfcc_delta, mfcc_delta2]).T
-            self.sound_model = {
-                'mfcc': features,
-                'frames': features.shape[0],
-                'path': path,
-                'duration': len(y) / sr
-            }
-            self.is_trained = True
-            self.status_label.configure(text=f"⬤ Готов ({self.sound_model['duration']:.1f}с)",
-                                      style="ConfigStatusActive.TLabel")
-        except Exception as e:
-            self.is_trained = False
-            self.status_label.configure(text=f"⬤ Ошибка: {str(e)[:30]}", style="ConfigStatusError.TLabel")
-        finally:
-            self.update_appearance()
+        self.app.record_sound_for_config(self.profile)
     
     def test_trigger(self):
-        if not self.is_trained:
+        if not self.profile.is_trained:
             messagebox.showwarning("Не готово", "Сначала обучите модель звука!")
             return
-        self.app.test_single_config(self)
+        self.app.test_single_config(self.profile)
     
     def delete_self(self):
-        if messagebox.askyesno("Подтвердите удаление", f"Удалить профиль '{self.data['name']}'?"):
-            self.app.remove_config(self)
-    
-    def to_dict(self):
-        return {
-            'id': self.config_id,
-            'name': self.data['name'],
-            'sound_path': self.data['sound_path'],
-            'exe_path': self.data['exe_path'],
-            'threshold': self.data['threshold'],
-            'min_volume': self.data['min_volume'],
-            'enabled': self.data['enabled']
-        }
+        if messagebox.askyesno("Подтвердите удаление", f"Удалить профиль '{self.profile.data['name']}'?"):
+            self.app.remove_config(self.profile)
+
+class ProfileList(ttk.Frame):
+    """Виртуальный список профилей: ConfigPanel строятся только на видимые строки.
+    
+    Профили (engine.Profile) лежат в app.configs отдельно от интерфейса; при
+    прокрутке те же панели переставляются и перепривязываются к другим
+    профилям, поэтому загрузка тысячи профилей не создаёт ни одного лишнего
+    виджета. Строки одной высоты (по первой построенной панели); статус
+    строки хранится здесь и переживает перепривязку.
+    """
+    GAP = 16
+    
+    def __init__(self, parent, app):
+        super().__init__(parent, style='Main.TFrame')
+        self.app = app
+        self.canvas = tk.Canvas(self, bg='#1a1a1a', highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self.on_scroll)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.bind('<Configure>', self.on_resize)
+        self.canvas.bind_all("<MouseWheel>", lambda e: self.canvas.yview_scroll(int(-1*(e.delta/120)), "units"))
+        self.panels = []
+        self.statuses = {}
+        self.row_height = None
+    
+    @staticmethod
+    def visible_rows(top, height, row_height, count):
+        first = max(0, int(top // row_height))
+        last = min(count, int((top + height) // row_height) + 1)
+        return range(first, max(first, last))
+    
+    def create_panel(self):
+        panel = ConfigPanel(self.canvas, self.app)
+        item = self.canvas.create_window(5, 0, window=panel, anchor='nw',
+                                         width=max(1, self.canvas.winfo_width() - 10))
+        if self.row_height is None:
+            panel.update_idletasks()
+            self.row_height = panel.winfo_reqheight() + self.GAP
+        self.canvas.itemconfigure(item, height=self.row_height - self.GAP)
+        self.panels.append((panel, item))
+    
+    def refresh(self, profile=None):
+        """Перерисовать видимые строки (или только строку profile, если она на экране)."""
+        if profile is not None:
+            for panel, _ in self.panels:
+                if panel.profile is profile:
+                    panel.bind_profile(profile)
+            return
+        if self.row_height is None and self.app.configs:
+            self.create_panel()
+        if self.row_height is None:
+            return
+        self.canvas.configure(scrollregion=(0, 0, 0, len(self.app.configs) * self.row_height))
+        for panel, _ in self.panels:
+            panel.bind_profile(None)
+        self.layout()
+    
+    def layout(self):
+        if self.row_height is None:
+            return
+        rows = self.visible_rows(self.canvas.canvasy(0), self.canvas.winfo_height(),
+                                 self.row_height, len(self.app.configs))
+        while len(self.panels) < len(rows):
+            self.create_panel()
+        for k, (panel, item) in enumerate(self.panels):
+            if k < len(rows):
+                profile = self.app.configs[rows[k]]
+                self.canvas.coords(item, 5, rows[k] * self.row_height + self.GAP // 2)
+                if panel.profile is not profile:
+                    panel.bind_profile(profile)
+            else:
+                self.canvas.coords(item, 5, -self.row_height * (k + 1))
+                panel.bind_profile(None)
+    
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.layout()
+    
+    def on_resize(self, event):
+        for _, item in self.panels:
+            self.canvas.itemconfigure(item, width=max(1, event.width - 10))
+        self.layout()
+    
+    def visible(self):
+        return [panel for panel, _ in self.panels if panel.profile is not None]
+    
+    def scroll_to(self, profile):
+        if self.row_height is not None and profile in self.app.configs:
+            index = self.app.configs.index(profile)
+            self.canvas.yview_moveto(index / max(1, len(self.app.configs)))
+    
+    def status_of(self, profile):
+        return self.statuses.get(profile.config_id, ("⬤ Модель не обучена", "ConfigStatusInactive.TLabel"))
+    
+    def set_status(self, profile, text, style):
+        self.statuses[profile.config_id] = (text, style)
+        for panel in self.visible():
+            if panel.profile is profile:
+                panel.status_label.configure(text=text, style=style)
+    
+    def update_appearance(self, profile):
+        if profile.is_trained and profile.data['enabled']:
+            self.set_status(profile, "⬤ Готов", "ConfigStatusActive.TLabel")
+        elif not profile.data['enabled']:
+            self.set_status(profile, "⬤ Отключён", "ConfigStatusDisabled.TLabel")
+        else:
+            self.set_status(profile, "⬤ Модель не обучена", "ConfigStatusInactive.TLabel")
+        self.refresh(profile)
+    
+    def forget(self, profile):
+        self.statuses.pop(profile.config_id, None)
+
+class TrainingScheduler:
+    """Обучение профилей в пуле процессов без блокировки цикла Tk.
+
+    Шаблоны, уже лежащие в кэше, читаются сразу в главном потоке (через mmap,
+    за миллисекунды); в пул уходят только промахи. Пул запускается в контексте
+    spawn, чтобы не делать fork при работающих потоках Tk и PortAudio.
+    librosa нужна только для промахов: без неё профиль получает ошибку, а
+    остальные профили из кэша и пакетов работают.
+    Результаты забираются опросом через root.after и применяются к профилям
+    в главном потоке по мере готовности, поэтому прослушивание можно начать
+    сразу после первого обученного профиля.
+    """
+    POLL_MS = 50
+    
+    def __init__(self, app, workers=None):
+        self.app = app
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.executor = None
+        self.pending = {}
+        self.polling = False
+        self.librosa_warned = False
+    
+    def ensure_executor(self):
+        if self.executor is None:
+            try:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            except Exception as e:
+                print(f"Training pool error: {e}")
+                self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self.executor
+    
+    def submit(self, profile):
+        cache = self.app.template_cache
+        paths = profile_paths(profile.data)
+        previous = self.pending.pop(profile.config_id, None)
+        if previous is not None:
+            previous[1].cancel()
+        try:
+            model = cache.load_profile(paths)
+        except Exception as e:
+            print(f"Template cache error: {e}")
+            model = None
+        if model is not None:
+            self.app.apply_model(profile, model)
+            return
+        if importlib.util.find_spec('librosa') is None:
+            self.app.apply_model(profile, None, ModuleNotFoundError("нет пакета librosa"))
+            if not self.librosa_warned:
+                self.librosa_warned = True
+                messagebox.showwarning("Нужна librosa",
+                                       "Для обучения профилей по звуковым файлам нужен пакет librosa:\n"
+                                       "pip install librosa\n"
+                                       "Профили из кэша шаблонов и пакетов работают без него.")
+            return
+        try:
+            future = self.ensure_executor().submit(_train_worker, paths, cache.directory, cache.rate)
+        except Exception as e:
+            print(f"Training pool error: {e}")
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+            future = self.executor.submit(_train_worker, paths, cache.directory, cache.rate)
+        self.pending[profile.config_id] = (profile, future, paths)
+        if not self.polling:
+            self.polling = True
+            self.app.root.after(self.POLL_MS, self.poll)
+    
+    def busy(self):
+        return len(self.pending)
+    
+    def poll(self):
+        for config_id, (profile, future, paths) in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[config_id]
+            if future.cancelled() or profile not in self.app.configs or profile_paths(profile.data) != paths:
+                continue
+            try:
+                self.app.apply_model(profile, future.result())
+            except Exception as e:
+                self.app.apply_model(profile, None, e)
+        self.app.update_stats()
+        if self.pending:
+            self.app.root.after(self.POLL_MS, self.poll)
+        else:
+            self.polling = False
+    
+    def close(self):
+        for profile, future, paths in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+class UiChannel:
+    """Единственный путь обновлений интерфейса из фоновых потоков.
+
+    post() только кладёт колбэк в словарь под замком, вызывать его можно из
+    любого потока. Главный поток забирает накопленное раз в REFRESH_MS и
+    выполняет. Колбэки с одинаковым ключом сливаются: до применения доживает
+    последний. Если ключей накопилось больше MAX_PENDING, новые отбрасываются.
+    Колбэки с ключом None не сливаются и не отбрасываются (диалоги, ошибки).
+    Следующий опрос планируется до выполнения колбэков: модальный диалог
+    крутит свой цикл событий, и обновления продолжают идти, пока он открыт.
+    """
+    REFRESH_MS = 40
+    MAX_PENDING = 64
+    
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.posted = 0
+        self.applied = 0
+        self.merged = 0
+        self.dropped = 0
+        self.closed = False
+    
+    def post(self, key, callback):
+        with self.lock:
+            self.posted += 1
+            if key is None:
+                key = object()
+            elif key in self.pending:
+                self.merged += 1
+                del self.pending[key]
+            elif len(self.pending) >= self.MAX_PENDING:
+                self.dropped += 1
+                return
+            self.pending[key] = callback
+    
+    def start(self):
+        self.root.after(self.REFRESH_MS, self.poll)
+    
+    def poll(self):
+        if self.closed:
+            return
+        self.root.after(self.REFRESH_MS, self.poll)
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        self.applied += len(pending)
+        for callback in pending.values():
+            try:
+                callback()
+            except Exception as e:
+                print(f"UI update error: {e}")
     
-    def from_dict(self, data):
-        self.config_id = data.get('id', str(uuid.uuid4()))
-        self.data.update(data)
-        self.name_var.set(self.data['name'])
-        self.sound_path_var.set(self.data['sound_path'])
-        self.exe_path_var.set(self.data['exe_path'])
-        self.thresh_var.set(self.data['threshold'])
-        self.vol_var.set(self.data['min_volume'])
-        self.enabled_var.set(self.data['enabled'])
-        self.on_thresh_change(self.data['threshold'])
-        self.on_vol_change(self.data['min_volume'])
-        self.on_toggle()
-        if self.data['sound_path']:
-            self.train_model()
+    def snapshot(self):
+        return {'posted': self.posted, 'applied': self.applied, 'merged': self.merged, 'dropped': self.dropped}
+    
+    def close(self):
+        self.closed = True
 
-class SoundTriggerApp:
+class SoundTriggerApp(DetectionEngine):
     def __init__(self, root):
+        super().__init__()
         self.root = root
         self.root.title("SonicTrigger • Активатор приложений по звуку")
         self.root.geometry("800x750")
         self.root.minsize(750, 600)
         self.root.configure(bg='#1a1a1a')
         
-        self.CHUNK = 1024
         self.FORMAT = pyaudio.paInt16
-        self.CHANNELS = 1
-        self.RATE = 16000
-        self.BUFFER_DURATION = 1.0
-        self.BUFFER_SIZE = int(self.RATE / self.CHUNK * self.BUFFER_DURATION)
-        
-        self.is_listening = False
         self.audio_thread = None
-        self.configs = []
-        self.trigger_count = 0
         self.last_visual_feedback = 0
-        self.config_file = Path.home() / ".sonictrigger_config.json"
+        self.input_level = -100.0
+        self.STATS_DUMP_INTERVAL = 10.0
+        self.stats_file = self.config_file.parent / ".sonictrigger_stats.json"
+        self.last_stats_dump = 0
+        self.trainer = TrainingScheduler(self)
+        self.ui = UiChannel(root)
+        self.ui.start()
+        self.restore_jobs = {}
         self.setup_styles()
         self.create_ui()
         self.load_configurations()
@@ -404,6 +644,13 @@ class SoundTriggerApp:
         style.map('ConfigSlider.Horizontal.TScale',
                 sliderbackground=[('active', colors['slider_slider'])])
         
+        style.configure('Mode.TCheckbutton', background=colors['bg'],
+                      foreground=colors['text'], font=('Segoe UI', 9))
+        style.configure('Mode.TCombobox', fieldbackground=colors['panel'], background=colors['border'],
+                      foreground=colors['text'], arrowcolor=colors['text'], borderwidth=0)
+        style.map('Mode.TCombobox', fieldbackground=[('readonly', colors['panel'])],
+                foreground=[('readonly', colors['text'])])
+        
         style.configure('Vertical.TScrollbar', background=colors['panel'],
                       troughcolor=colors['bg'], borderwidth=0,
                       arrowcolor=colors['text_dim'], darkcolor=colors['bg'],
@@ -422,6 +669,19 @@ class SoundTriggerApp:
         control_frame.pack(fill='x', padx=20, pady=(0, 15))
         self.status_label = ttk.Label(control_frame, text="● Статус: Ожидание", style='Status.TLabel')
         self.status_label.pack(side='left', padx=(0, 20))
+        self.mode_var = tk.StringVar(value=self.MATCH_MODES[self.settings['match_mode']])
+        mode_box = ttk.Combobox(control_frame, textvariable=self.mode_var, state='readonly', width=15,
+                              values=list(self.MATCH_MODES.values()), style='Mode.TCombobox')
+        mode_box.pack(side='left')
+        mode_box.bind('<<ComboboxSelected>>', self.on_mode_change)
+        self.backend_var = tk.StringVar(value=self.MATCH_BACKENDS[self.settings['match_backend']])
+        backend_box = ttk.Combobox(control_frame, textvariable=self.backend_var, state='readonly', width=13,
+                                 values=list(self.MATCH_BACKENDS.values()), style='Mode.TCombobox')
+        backend_box.pack(side='left', padx=(6, 0))
+        backend_box.bind('<<ComboboxSelected>>', self.on_backend_change)
+        self.adaptive_var = tk.BooleanVar(value=self.settings['adaptive'])
+        ttk.Checkbutton(control_frame, text="Адаптация к фону", variable=self.adaptive_var,
+                      style='Mode.TCheckbutton', command=self.on_adaptive_change).pack(side='left', padx=(10, 0))
         
         btn_frame = ttk.Frame(control_frame, style='Main.TFrame')
         btn_frame.pack(side='right')
@@ -433,35 +693,48 @@ class SoundTriggerApp:
         ttk.Button(btn_frame, text="💾 Сохранить",
                  style='ConfigButton.TButton', command=self.save_configurations).pack(side='left', padx=(0, 5))
         ttk.Button(btn_frame, text="📂 Загрузить",
-                 style='ConfigButton.TButton', command=self.load_configurations).pack(side='left')
+                 style='ConfigButton.TButton', command=self.load_configurations).pack(side='left', padx=(0, 5))
+        ttk.Button(btn_frame, text="📦 Экспорт",
+                 style='ConfigButton.TButton', command=self.export_bundle).pack(side='left', padx=(0, 5))
+        ttk.Button(btn_frame, text="📥 Импорт",
+                 style='ConfigButton.TButton', command=self.import_bundle).pack(side='left')
         
-        canvas_frame = ttk.Frame(self.root, style='Main.TFrame')
-        canvas_frame.pack(fill='both', expand=True, padx=20, pady=(0, 15))
-        canvas = tk.Canvas(canvas_frame, bg='#1a1a1a', highlightthickness=0)
-        scrollbar = ttk.Scrollbar(canvas_frame, orient="vertical", command=canvas.yview)
-        self.scrollable_frame = ttk.Frame(canvas, style='Main.TFrame')
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1*(e.delta/120)), "units"))
+        self.profile_list = ProfileList(self.root, self)
+        self.profile_list.pack(fill='both', expand=True, padx=20, pady=(0, 15))
         
         stats_frame = ttk.Frame(self.root, style='Stats.TFrame')
         stats_frame.pack(fill='x', padx=20, pady=(0, 15))
         ttk.Label(stats_frame, text="Всего срабатываний:", style='StatsLabel.TLabel').pack(side='left', padx=(15, 5))
         self.triggers_label = ttk.Label(stats_frame, text="0", style='StatsValue.TLabel')
         self.triggers_label.pack(side='left', padx=(0, 20))
+        ttk.Label(stats_frame, text="Потери / пропуски:", style='StatsLabel.TLabel').pack(side='left', padx=(15, 5))
+        self.losses_label = ttk.Label(stats_frame, text="0 / 0", style='StatsValue.TLabel')
+        self.losses_label.pack(side='left', padx=(0, 20))
         ttk.Label(stats_frame, text="Активных профилей:", style='StatsLabel.TLabel').pack(side='left', padx=(15, 5))
         self.active_label = ttk.Label(stats_frame, text="0", style='StatsValue.TLabel')
         self.active_label.pack(side='left', padx=(0, 20))
+        ttk.Label(stats_frame, text="Уровень:", style='StatsLabel.TLabel').pack(side='left', padx=(15, 5))
+        self.level_label = ttk.Label(stats_frame, text="—", style='StatsValue.TLabel')
+        self.level_label.pack(side='left', padx=(0, 20))
+        ttk.Label(stats_frame, text="Фон:", style='StatsLabel.TLabel').pack(side='left', padx=(15, 5))
+        self.floor_label = ttk.Label(stats_frame, text="—", style='StatsValue.TLabel')
+        self.floor_label.pack(side='left', padx=(0, 20))
         ttk.Label(stats_frame, text="Статус:", style='StatsLabel.TLabel').pack(side='left', padx=(15, 5))
         self.stats_status = ttk.Label(stats_frame, text="Ожидание", style='StatsValue.TLabel')
         self.stats_status.pack(side='left')
         
+        cascade_frame = ttk.Frame(self.root, style='Stats.TFrame')
+        cascade_frame.pack(fill='x', padx=20, pady=(0, 15))
+        ttk.Label(cascade_frame, text="Отсеяно до DTW:", style='StatsLabel.TLabel').pack(side='left', padx=(15, 5))
+        self.cascade_label = ttk.Label(cascade_frame, text="—", style='StatsLabel.TLabel')
+        self.cascade_label.pack(side='left', pady=4)
+        
+        perf_frame = ttk.Frame(self.root, style='Stats.TFrame')
+        perf_frame.pack(fill='x', padx=20, pady=(0, 15))
+        ttk.Label(perf_frame, text="Производительность:", style='StatsLabel.TLabel').pack(side='left', padx=(15, 5))
+        self.perf_label = ttk.Label(perf_frame, text="—", style='StatsLabel.TLabel')
+        self.perf_label.pack(side='left', pady=4)
+        
         hint_frame = ttk.Frame(self.root, style='Main.TFrame')
         hint_frame.pack(fill='x', padx=20, pady=(0, 10))
         hint = ttk.Label(hint_frame,
@@ -470,28 +743,133 @@ class SoundTriggerApp:
         hint.pack(anchor='w')
     
     def add_config(self, config_data=None):
-        panel = ConfigPanel(self.scrollable_frame, self)
-        if config_data:
-            panel.from_dict(config_data)
-        panel.pack(fill='x', pady=8, padx=5)
-        self.configs.append(panel)
+        profile = self.create_profile(config_data or {'name': f"Триггер {len(self.configs) + 1}"})
+        self.configs.append(profile)
+        self.profile_list.refresh()
+        self.profile_list.scroll_to(profile)
         self.update_stats()
-        return panel
+        return profile
+    
+    def create_profile(self, data):
+        return self.show_profile(Profile(data))
     
-    def remove_config(self, panel):
-        panel.pack_forget()
-        self.configs.remove(panel)
+    def show_profile(self, profile):
+        self.profile_list.update_appearance(profile)
+        if profile.is_trained:
+            self.apply_model(profile, profile.sound_model)
+        elif profile.data['sound_path']:
+            self.train_profile(profile)
+        return profile
+    
+    def set_profiles(self, profiles):
+        self.profile_list.statuses.clear()
+        self.configs = [self.show_profile(profile) for profile in profiles]
+        if not self.configs:
+            self.add_config()
+        self.bank_dirty = True
+        self.profile_list.refresh()
         self.update_stats()
     
+    def remove_config(self, profile):
+        self.configs.remove(profile)
+        self.profile_list.forget(profile)
+        self.profile_list.refresh()
+        self.bank_dirty = True
+        self.update_stats()
+    
+    def train_profile(self, profile):
+        paths = profile_paths(profile.data)
+        if not profile.data['sound_path'] or not all(os.path.exists(p) for p in paths):
+            self.profile_list.set_status(profile, "⬤ Файл не выбран", "ConfigStatusError.TLabel")
+            profile.is_trained = False
+            self.profile_list.refresh(profile)
+            return
+        
+        self.profile_list.set_status(profile, "⬤ Обучение...", "ConfigStatusBusy.TLabel")
+        self.trainer.submit(profile)
+    
+    def apply_model(self, profile, model, error=None):
+        profile.apply_model(model, error)
+        if error is None:
+            examples = len(model.get('paths', ()))
+            suffix = f", примеров: {examples}" if examples > 1 else ""
+            self.profile_list.set_status(profile, f"⬤ Готов ({model['duration']:.1f}с{suffix})",
+                                         "ConfigStatusActive.TLabel")
+        else:
+            self.profile_list.set_status(profile, f"⬤ Ошибка: {str(error)[:30]}", "ConfigStatusError.TLabel")
+        self.bank_dirty = True
+        self.profile_list.refresh(profile)
+    
+    def set_sound(self, profile, path):
+        profile.data['sound_path'] = path
+        self.profile_list.refresh(profile)
+        self.train_profile(profile)
+    
+    def resolve_action(self, profile):
+        profile.resolve_action()
+        if profile.action_error is not None:
+            messagebox.showwarning("Файл не найден", str(profile.action_error))
+    
     def update_stats(self):
-        active = sum(1 for c in self.configs if c.enabled_var.get() and c.is_trained)
+        active = sum(1 for c in self.configs if c.data['enabled'] and c.is_trained)
         self.active_label.config(text=str(active))
         self.triggers_label.config(text=str(self.trigger_count))
+        self.losses_label.config(text=f"{self.dropped_chunks + self.overrun_chunks} / {self.skipped_windows}")
+        rejected = self.cascade.rejected
+        self.cascade_label.config(
+            text=f"громкость {rejected['volume']} · длительность {rejected['duration']} · "
+                 f"спектр {rejected['centroid']} · огибающая {rejected['envelope']} · "
+                 f"DTW запусков {self.cascade.dtw_runs} (LB отсеял {self.cascade.pruning['lower_bound']}, "
+                 f"прервано {self.cascade.pruning['abandoned']}), без совпадения {rejected['dtw']}")
         self.stats_status.config(text="Прослушивание" if self.is_listening else "Ожидание")
+        adaptive = self.is_listening and self.settings['adaptive']
+        self.floor_label.config(text=f"{self.background.floor:.4f}" if adaptive else "—")
+        self.level_label.config(text=f"{self.input_level:.0f} дБ" if self.is_listening else "—")
+        for panel in self.profile_list.visible():
+            panel.show_effective(self.effective_threshold(panel.profile),
+                                 self.volume_gate(panel.profile) if adaptive else None)
+        self.perf_label.config(text=self.format_performance(self.timers.snapshot()))
+    
+    def performance(self):
+        snapshot = super().performance()
+        snapshot['ui'] = self.ui.snapshot()
+        return snapshot
+    
+    def format_performance(self, snapshot):
+        stages = snapshot['stages']
+        if snapshot['realtime_factor'] is None:
+            return "—"
+        def p50(stage):
+            return f"{stages[stage]['p50_ms']:.2f}" if stage in stages else "—"
+        dispatch = f"{stages['dispatch']['p99_ms']:.0f}" if 'dispatch' in stages else "—"
+        return (f"RTF {snapshot['realtime_factor']:.2f} · очередь {snapshot['queue_depth']['last']}"
+                f"/{snapshot['queue_depth']['max']} · ожидание {p50('capture_wait')} · буфер {p50('buffer')} · "
+                f"признаки {p50('features')} · DTW/профиль {p50('dtw_profile')} мс (p50) · запуск {dispatch} мс (p99) · "
+                f"UI слито {self.ui.merged}, отброшено {self.ui.dropped}")
+    
+    def on_mode_change(self, event=None):
+        for mode, title in self.MATCH_MODES.items():
+            if title == self.mode_var.get():
+                self.settings['match_mode'] = mode
+        self.subsequence.reset()
+    
+    def on_adaptive_change(self):
+        self.settings['adaptive'] = self.adaptive_var.get()
+        self.background.reset()
+    
+    def on_backend_change(self, event=None):
+        for backend, title in self.MATCH_BACKENDS.items():
+            if title == self.backend_var.get():
+                self.settings['match_backend'] = backend
+        self.bank_dirty = True
     
     def toggle_listening(self):
         if not self.is_listening:
-            active = [c for c in self.configs if c.enabled_var.get() and c.is_trained]
+            active = [c for c in self.configs if c.data['enabled'] and c.is_trained]
+            if not active and self.trainer.busy():
+                messagebox.showinfo("Обучение", "Профили ещё обучаются, прослушивание можно начать "
+                                              "после готовности первого из них.")
+                return
             if not active:
                 messagebox.showwarning("Нет активных триггеров",
                                      "Добавьте хотя бы один обученный и включённый профиль!")
@@ -499,121 +877,83 @@ class SoundTriggerApp:
             self.is_listening = True
             self.status_label.config(text="● Статус: Прослушивание", style='StatusActive.TLabel')
             self.listen_btn.config(text="⏹ Остановить", style='StopButton.TButton')
+            self.dropped_chunks = self.overrun_chunks = self.skipped_windows = 0
+            self.cascade.reset()
+            self.timers.reset()
+            self.last_stats_dump = time.time()
+            self.capture_level_meter(True)
             self.audio_thread = threading.Thread(target=self.audio_loop, daemon=True)
             self.audio_thread.start()
+            self.poll_stats()
         else:
             self.is_listening = False
             self.status_label.config(text="● Статус: Остановка...", style='Status.TLabel')
             self.listen_btn.config(text="▶ Начать прослушивание", style='MainButton.TButton')
     
-    def audio_loop(self):
-        try:
-            p = pyaudio.PyAudio()
-            stream = p.open(format=self.FORMAT,
-                          channels=self.CHANNELS,
-                          rate=self.RATE,
-                          input=True,
-                          frames_per_buffer=self.CHUNK)
-            buffer = []
-            self.status_label.config(text="● Статус: Прослушивание", style='StatusActive.TLabel')
-            self.update_stats()
-            while self.is_listening:
-                try:
-                    data = stream.read(self.CHUNK, exception_on_overflow=False)
-                    buffer.append(data)
-                    if len(buffer) > self.BUFFER_SIZE:
-                        buffer.pop(0)
-                    if len(buffer) == self.BUFFER_SIZE:
-                        audio_data = b''.join(buffer)
-                        self.process_audio(audio_data)
-                except Exception as e:
-                    print(f"Audio error: {e}")
-                if not self.is_listening:
-                    break
-                time.sleep(0.01)
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Ошибка аудио",
-                                                          f"Не удалось получить доступ к микрофону:\n{str(e)}\nУбедитесь, что разрешения на микрофон включены."))
-        finally:
+    def poll_stats(self):
+        self.update_stats()
+        if time.time() - self.last_stats_dump >= self.STATS_DUMP_INTERVAL:
+            self.last_stats_dump = time.time()
             try:
-                stream.stop_stream()
-                stream.close()
-                p.terminate()
-            except:
-                pass
-            if not self.is_listening:
-                self.root.after(0, lambda: self.status_label.config(
-                    text="● Статус: Ожидание", style='Status.TLabel'))
-                self.root.after(0, lambda: self.listen_btn.config(
-                    text="▶ Начать прослушивание", style='MainButton.TButton'))
-                self.root.after(0, self.update_stats)
+                self.dump_performance(self.stats_file)
+            except Exception as e:
+                print(f"Stats dump error: {e}")
+        if self.is_listening:
+            self.root.after(500, self.poll_stats)
+    
+    def on_trigger(self, config, distance):
+        self.ui.post(('trigger', config.config_id), lambda: self.trigger_action(config, distance))
+        self.dispatch_action(config)
+        self.ui.post('feedback', self.visual_feedback)
+    
+    def on_action_result(self, config, error):
+        if error is not None:
+            self.ui.post(('trigger', config.config_id), lambda: self.profile_list.set_status(
+                config, f"⬤ Ошибка запуска: {str(error)[:30]}", 'ConfigStatusError.TLabel'))
     
-    def process_audio(self, audio_data):
-        audio_array = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-        if len(audio_array) == 0:
+    def on_audio_error(self, error):
+        self.ui.post(None, lambda: messagebox.showerror("Ошибка аудио",
+                                                      f"Не удалось получить доступ к микрофону:\n{str(error)}\nУбедитесь, что разрешения на микрофон включены."))
+    
+    def capture_level_meter(self, enabled):
+        if not enabled:
+            self.capture.unsubscribe(self.on_level_block)
             return
-        rms = np.sqrt(np.mean(audio_array**2))
-        normalized_volume = rms / 32768.0
-        current_time = time.time()
-        
-        for config in self.configs:
-            if not (config.enabled_var.get() and config.is_trained):
-                continue
-            if normalized_volume < config.data['min_volume']:
-                continue
-            if current_time - config.last_trigger < config.cooldown:
-                continue
-            distance = self.compare_audio(audio_array, config.sound_model)
-            if distance < config.data['threshold']:
-                config.last_trigger = current_time
-                self.trigger_count += 1
-                self.root.after(0, lambda c=config, d=distance: self.trigger_action(c, d))
-                self.root.after(0, self.visual_feedback)
-                time.sleep(0.15)
-    
-    def compare_audio(self, audio_array, model):
         try:
-            y = audio_array / 32768.0
-            if len(y) < self.RATE * 0.4:
-                return float('inf')
-            y = librosa.util.normalize(y)
-            mfcc = librosa.feature.mfcc(
-                y=y, sr=self.RATE, n_mfcc=13, n_fft=512, hop_length=256
-            )
-            mfcc_delta = librosa.feature.delta(mfcc)
-            mfcc_delta2 = librosa.feature.delta(mfcc, order=2)
-            features = np.vstack([mfcc, mfcc_delta, mfcc_delta2]).T
-            distance, _ = fastdtw(features, model['mfcc'], dist=euclidean)
-            return distance / model['frames']
+            self.capture.subscribe(self.on_level_block)
         except Exception as e:
-            print(f"Comparison error: {e}")
-            return float('inf')
+            print(f"Level meter error: {e}")
+    
+    def on_level_block(self, in_data, status):
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        rms = np.sqrt(np.dot(samples, samples.astype(np.float64)) / max(len(samples), 1)) / 32768.0
+        self.input_level = 20.0 * np.log10(max(rms, 1e-5))
+    
+    def on_stopped(self):
+        self.capture_level_meter(False)
+        if not self.is_listening:
+            def stopped():
+                self.status_label.config(text="● Статус: Ожидание", style='Status.TLabel')
+                self.listen_btn.config(text="▶ Начать прослушивание", style='MainButton.TButton')
+                self.update_stats()
+            self.ui.post('status', stopped)
     
     def trigger_action(self, config, distance):
-        exe_path = config.data['exe_path'].strip()
-        if not exe_path:
-            self.root.after(0, lambda: messagebox.showwarning("Нет приложения",
-                                                          f"В профиле '{config.data['name']}' не указано приложение!"))
-            return
-        if not os.path.exists(exe_path):
-            self.root.after(0, lambda: messagebox.showerror("Файл не найден",
-                                                          f"Приложение не найдено:\n{exe_path}"))
-            return
-        
-        original_bg = config.status_label.cget('style')
-        config.status_label.configure(text=f"⬤ Сработало! ({distance:.1f})",
-                                    style='ConfigStatusActive.TLabel')
-        try:
-            subprocess.Popen([exe_path], shell=True, cwd=os.path.dirname(exe_path))
-            self.root.after(2000, lambda: config.status_label.configure(
-                text=f"⬤ Готов ({config.sound_model['duration']:.1f}с)",
-                style='ConfigStatusActive.TLabel'))
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Ошибка запуска",
-                                                          f"Не удалось запустить {os.path.basename(exe_path)}:\n{str(e)}"))
-            self.root.after(2000, lambda: config.status_label.configure(
-                text="⬤ Ошибка запуска", style='ConfigStatusError.TLabel'))
-        self.update_stats()
+        if config.action_error is not None:
+            self.profile_list.set_status(config, "⬤ Приложение не найдено", 'ConfigStatusError.TLabel')
+        elif config.action is None:
+            self.profile_list.set_status(config, f"⬤ Сработало, приложение не указано ({distance:.1f})",
+                                         'ConfigStatusActive.TLabel')
+        else:
+            self.profile_list.set_status(config, f"⬤ Сработало! ({distance:.1f})", 'ConfigStatusActive.TLabel')
+            def restore():
+                self.restore_jobs.pop(config.config_id, None)
+                if config.sound_model and self.profile_list.status_of(config)[1] != 'ConfigStatusError.TLabel':
+                    self.profile_list.set_status(config, f"⬤ Готов ({config.sound_model['duration']:.1f}с)",
+                                                 'ConfigStatusActive.TLabel')
+            if config.config_id in self.restore_jobs:
+                self.root.after_cancel(self.restore_jobs[config.config_id])
+            self.restore_jobs[config.config_id] = self.root.after(2000, restore)
     
     def visual_feedback(self):
         current_time = time.time()
@@ -632,75 +972,52 @@ class SoundTriggerApp:
     def record_sound_for_config(self, config):
         def record():
             try:
-                p = pyaudio.PyAudio()
-                stream = p.open(format=self.FORMAT,
-                              channels=self.CHANNELS,
-                              rate=self.RATE,
-                              input=True,
-                              frames_per_buffer=self.CHUNK)
                 for i in range(3, 0, -1):
-                    self.root.after(0, lambda i=i: messagebox.showinfo("Запись",
+                    self.ui.post(None, lambda i=i: messagebox.showinfo("Запись",
                                                                   f"Запись начнётся через {i}...\nИзготовьте звук-триггер!"))
                     time.sleep(1)
-                self.root.after(0, lambda: self.status_label.config(
+                self.ui.post('status', lambda: self.status_label.config(
                     text="● Запись звука...", style='Status.TLabel'))
-                frames = []
-                for _ in range(0, int(self.RATE / self.CHUNK * 2.0)):
-                    data = stream.read(self.CHUNK, exception_on_overflow=False)
-                    frames.append(data)
-                stream.stop_stream()
-                stream.close()
-                p.terminate()
-                
-                filename = filedialog.asksaveasfilename(
-                    defaultextension=".wav",
-                    filetypes=[("WAV файлы", "*.wav")],
-                    initialfile=f"trigger_{config.data['name'].replace(' ', '_')}.wav",
-                    title="Сохранить звук-триггер"
-                )
-                if filename:
-                    wf = wave.open(filename, 'wb')
-                    wf.setnchannels(self.CHANNELS)
-                    wf.setsampwidth(p.get_sample_size(self.FORMAT))
-                    wf.setframerate(self.RATE)
-                    wf.writeframes(b''.join(frames))
-                    wf.close()
-                    
-                    self.root.after(0, lambda: config.sound_path_var.set(filename))
-                    self.root.after(0, lambda: config.data.update({'sound_path': filename}))
-                    self.root.after(0, config.train_model)
-                    self.root.after(0, lambda: self.status_label.config(
-                        text="● Статус: Ожидание", style='Status.TLabel' if not self.is_listening else 'StatusActive.TLabel'))
+                audio_data = self.capture.record(2.0)
+                self.ui.post(None, lambda: self.save_recording(config, audio_data))
             except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("Ошибка записи", str(e)))
-                self.root.after(0, lambda: self.status_label.config(
+                self.ui.post(None, lambda e=e: messagebox.showerror("Ошибка записи", str(e)))
+                self.ui.post('status', lambda: self.status_label.config(
                     text="● Статус: Ожидание", style='Status.TLabel'))
-            self.is_listening = False
         threading.Thread(target=record, daemon=True).start()
     
+    def save_recording(self, config, audio_data):
+        try:
+            filename = filedialog.asksaveasfilename(
+                defaultextension=".wav",
+                filetypes=[("WAV файлы", "*.wav")],
+                initialfile=f"trigger_{config.data['name'].replace(' ', '_')}.wav",
+                title="Сохранить звук-триггер"
+            )
+            if filename:
+                wf = wave.open(filename, 'wb')
+                wf.setnchannels(self.CHANNELS)
+                wf.setsampwidth(pyaudio.get_sample_size(self.FORMAT))
+                wf.setframerate(self.RATE)
+                wf.writeframes(audio_data)
+                wf.close()
+                
+                self.set_sound(config, filename)
+        except Exception as e:
+            messagebox.showerror("Ошибка записи", str(e))
+        self.status_label.config(
+            text="● Статус: Прослушивание" if self.is_listening else "● Статус: Ожидание",
+            style='StatusActive.TLabel' if self.is_listening else 'Status.TLabel')
+    
     def test_single_config(self, config):
         def test():
             try:
-                p = pyaudio.PyAudio()
-                stream = p.open(format=self.FORMAT,
-                              channels=self.CHANNELS,
-                              rate=self.RATE,
-                              input=True,
-                              frames_per_buffer=self.CHUNK)
-                self.root.after(0, lambda: messagebox.showinfo("Режим теста",
+                self.ui.post(None, lambda: messagebox.showinfo("Режим теста",
                                                             "Изготовьте звук-триггер сейчас (2 секунды)..."))
                 time.sleep(0.5)
-                frames = []
-                for _ in range(0, int(self.RATE / self.CHUNK * 2.0)):
-                    data = stream.read(self.CHUNK, exception_on_overflow=False)
-                    frames.append(data)
-                stream.stop_stream()
-                stream.close()
-                p.terminate()
-                
-                audio_data = b''.join(frames)
-                audio_array = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-                distance = self.compare_audio(audio_array, config.sound_model)
+                audio_data = self.capture.record(2.0)
+                y = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+                distance = self.compare_audio(y, config.sound_model)
                 
                 if distance < config.data['threshold']:
                     result = f"✅ СРАБОТАЛО! (дистанция: {distance:.2f})"
@@ -708,17 +1025,15 @@ class SoundTriggerApp:
                 else:
                     result = f"❌ Не сработало (дистанция: {distance:.2f} > порог {config.data['threshold']:.1f})"
                     color = '#ff7675'
-                self.root.after(0, lambda: messagebox.showinfo("Результат теста",
+                self.ui.post(None, lambda: messagebox.showinfo("Результат теста",
                                                             f"Профиль: {config.data['name']}\n{result}"))
             except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("Ошибка теста", str(e)))
+                self.ui.post(None, lambda e=e: messagebox.showerror("Ошибка теста", str(e)))
         threading.Thread(target=test, daemon=True).start()
     
     def save_configurations(self):
-        configs = [panel.to_dict() for panel in self.configs]
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(configs, f, indent=2, ensure_ascii=False)
+            write_config(self.config_file, self.settings, [profile.to_dict() for profile in self.configs])
             messagebox.showinfo("Сохранено", f"Конфигурация сохранена в:\n{self.config_file}")
         except Exception as e:
             messagebox.showerror("Ошибка сохранения", f"Не удалось сохранить конфигурацию:\n{str(e)}")
@@ -735,49 +1050,70 @@ class SoundTriggerApp:
                 'enabled': True
             }]
             self.config_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(default_config, f, indent=2)
+            write_config(self.config_file, self.settings, default_config)
             configs = default_config
         else:
             try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    configs = json.load(f)
+                settings, configs = read_config(self.config_file)
+                self.apply_settings(settings)
             except Exception as e:
                 messagebox.showwarning("Предупреждение",
                                      f"Не удалось загрузить конфигурацию:\n{str(e)}\nИспользуется конфигурация по умолчанию.")
                 configs = []
         
-        for panel in self.configs[:]:
-            self.remove_config(panel)
-        
-        if configs:
-            for config_data in configs:
-                self.add_config(config_data)
-        else:
-            self.add_config()
-        self.update_stats()
+        profiles = [Profile(config_data) for config_data in configs]
+        self.attach_bundle(profiles)
+        self.set_profiles(profiles)
         messagebox.showinfo("Загружено", f"Конфигурация загружена из:\n{self.config_file}")
     
+    def export_bundle(self):
+        path = filedialog.asksaveasfilename(defaultextension=".stbundle",
+                                            filetypes=[("Пакет профилей", "*.stbundle"), ("Все файлы", "*.*")],
+                                            title="Экспорт профилей с шаблонами")
+        if not path:
+            return
+        try:
+            written = ProfileBundle(path).save(self.settings, self.configs, self.RATE)
+        except Exception as e:
+            messagebox.showerror("Ошибка экспорта", f"Не удалось сохранить пакет:\n{str(e)}")
+            return
+        untrained = sum(not p.is_trained for p in self.configs)
+        note = f"\nБез шаблонов (не обучены): {untrained}" if untrained else ""
+        messagebox.showinfo("Экспорт", f"Профилей: {len(self.configs)}, записано {written / 1024:.0f} КБ в:\n{path}{note}")
+    
+    def import_bundle(self):
+        path = filedialog.askopenfilename(filetypes=[("Пакет профилей", "*.stbundle"), ("Все файлы", "*.*")],
+                                          title="Импорт профилей с шаблонами")
+        if not path:
+            return
+        try:
+            settings, profiles = ProfileBundle(path).read(self.RATE)
+        except Exception as e:
+            messagebox.showerror("Ошибка импорта", f"Не удалось прочитать пакет:\n{str(e)}")
+            return
+        self.apply_settings(settings)
+        self.settings['bundle'] = os.path.abspath(path)
+        self.set_profiles(profiles)
+    
+    def apply_settings(self, settings):
+        super().apply_settings(settings)
+        self.mode_var.set(self.MATCH_MODES[self.settings['match_mode']])
+        self.backend_var.set(self.MATCH_BACKENDS[self.settings['match_backend']])
+        self.adaptive_var.set(self.settings['adaptive'])
+    
     def on_close(self):
         self.is_listening = False
         if self.audio_thread and self.audio_thread.is_alive():
             self.audio_thread.join(timeout=1.0)
+        self.close_pool()
+        self.trainer.close()
+        self.capture.close()
+        self.actions.close()
+        self.ui.close()
         self.root.destroy()
 
 def check_dependencies():
-    missing = []
-    try:
-        import pyaudio
-    except ImportError:
-        missing.append("pyaudio")
-    try:
-        import librosa
-    except ImportError:
-        missing.append("librosa")
-    try:
-        from fastdtw import fastdtw
-    except ImportError:
-        missing.append("fastdtw")
+    missing = [pkg for pkg in ("pyaudio",) if importlib.util.find_spec(pkg) is None]
     if missing:
         root = tk.Tk()
         root.withdraw()
@@ -796,4 +1132,5 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""Офлайн-прогон WAV-записей через тот же оконный анализ, что и при прослушивании.
+
+    py replay.py запись1.wav запись2.wav                  # профили из ~/.sonictrigger_config.json
+    py replay.py длинная.wav --sound хлопок=clap.wav:3.0  # профиль без конфигурации
+    py replay.py длинная.wav --sound хлопок=clap1.wav,clap2.wav,clap3.wav:3.0
+    py replay.py *.wav --mode onset --json отчёт.json
+    py replay.py *.wav --bundle триггеры.stbundle          # профили с готовыми шаблонами
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from engine import DetectionEngine, Profile, ProfileBundle, read_config, profile_paths
+
+
+class ReplayEngine(DetectionEngine):
+    """DetectionEngine, которому чанки подаются из файла, а часы идут по времени записи."""
+
+    def __init__(self, config_file=None):
+        super().__init__(config_file)
+        self.position = 0
+        self.source = None
+        self.detections = []
+        self.latencies = []
+        self.distances = {}
+        self.wall = 0.0
+
+    def now(self):
+        return self.position / self.RATE
+
+    def on_trigger(self, config, distance):
+        self.detections.append({'file': self.source, 'time': round(self.now(), 3),
+                                'profile': config.data['name'], 'distance': round(float(distance), 3)})
+
+    def on_distances(self, distances, current_time):
+        for config_id, distance in distances.items():
+            if np.isfinite(distance):
+                self.distances.setdefault(config_id, []).append(distance)
+
+    def process_audio(self, window, feature_stream=None, config_ids=None):
+        start = time.perf_counter()
+        super().process_audio(window, feature_stream, config_ids)
+        self.latencies.append(time.perf_counter() - start)
+
+    def replay(self, path):
+        import librosa
+        y, _ = librosa.load(path, sr=self.RATE, mono=True)
+        samples = np.clip(np.round(y * 32768), -32768, 32767).astype(np.int16)
+        self.source = os.path.basename(path)
+        self.position = 0
+        for config in self.configs:
+            config.last_trigger = float('-inf')
+        self.reset_analysis()
+        started = time.perf_counter()
+        for start in range(0, len(samples) - self.CHUNK + 1, self.CHUNK):
+            self.position = start + self.CHUNK
+            self.analyze_block(samples[start:start + self.CHUNK])
+        self.wall += time.perf_counter() - started
+        return len(samples) / self.RATE
+
+
+def parse_sound(spec):
+    name, _, path = spec.partition('=')
+    threshold = 2.5
+    head, sep, tail = path.rpartition(':')
+    if sep:
+        try:
+            path, threshold = head, float(tail)
+        except ValueError:
+            pass
+    path, *extra = path.split(',')
+    return {'name': name, 'sound_path': path, 'extra_sounds': extra, 'threshold': threshold, 'enabled': True}
+
+
+def percentile_ms(values, q):
+    return float(np.percentile(values, q) * 1e3) if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-прогон записей через движок SonicTrigger")
+    parser.add_argument('wav', nargs='+', help="записи для прогона")
+    parser.add_argument('--config', help="файл конфигурации (по умолчанию ~/.sonictrigger_config.json)")
+    parser.add_argument('--sound', action='append', default=[], metavar="ИМЯ=ПУТЬ[,ПУТЬ...][:ПОРОГ]",
+                        help="профиль вместо конфигурации (можно несколько); пути через запятую — примеры одного профиля")
+    parser.add_argument('--bundle', help="пакет профилей с готовыми шаблонами (.stbundle) вместо конфигурации")
+    parser.add_argument('--mode', choices=sorted(DetectionEngine.MATCH_MODES))
+    parser.add_argument('--backend', choices=sorted(DetectionEngine.MATCH_BACKENDS))
+    parser.add_argument('--exact', action='store_true',
+                        help="считать DTW до конца, без раннего отсечения (точные дистанции для подбора порогов)")
+    parser.add_argument('--static', action='store_true',
+                        help="без адаптации к фону: пороги громкости и дистанции как в профиле")
+    parser.add_argument('--json', help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    engine = ReplayEngine(args.config)
+    engine.early_abandon = not args.exact
+    if args.sound:
+        engine.configs = [Profile(parse_sound(spec)) for spec in args.sound]
+    elif args.bundle:
+        settings, engine.configs = ProfileBundle(args.bundle).read(engine.RATE)
+        engine.apply_settings(settings)
+    else:
+        settings, profiles = read_config(engine.config_file)
+        engine.apply_settings(settings)
+        engine.configs = [Profile(data) for data in profiles]
+        engine.attach_bundle(engine.configs)
+    overrides = {'match_mode': args.mode, 'match_backend': args.backend}
+    engine.apply_settings({k: v for k, v in overrides.items() if v})
+    if args.static:
+        engine.apply_settings({'adaptive': False})
+    for profile in engine.configs:
+        if profile.data['enabled'] and profile.data['sound_path'] and not profile.is_trained:
+            try:
+                profile.apply_model(engine.template_cache.build_profile(profile_paths(profile.data)))
+            except Exception as e:
+                print(f"Training error ({profile.data['name']}): {e}")
+    if not any(p.is_trained and p.data['enabled'] for p in engine.configs):
+        print("Нет обученных и включённых профилей.")
+        return 2
+
+    audio_seconds = sum(engine.replay(path) for path in args.wav)
+    wall = engine.wall
+    engine.close_pool()
+
+    print(f"{'файл':<24}{'время, с':>10}  {'профиль':<20}{'дистанция':>10}")
+    for d in engine.detections:
+        print(f"{d['file']:<24}{d['time']:>10.2f}  {d['profile']:<20}{d['distance']:>10.2f}")
+    print(f"\n{'профиль':<20}{'порог':>7}{'эфф.':>8}{'срабат.':>9}{'мин.':>9}{'p05':>9}{'p50':>9}")
+    profiles = []
+    for p in engine.configs:
+        values = engine.distances.get(p.config_id, [])
+        hits = sum(d['profile'] == p.data['name'] for d in engine.detections)
+        row = {'profile': p.data['name'], 'threshold': p.data['threshold'],
+               'effective_threshold': engine.effective_threshold(p), 'detections': hits,
+               'min': float(np.min(values)) if values else None,
+               'p05': float(np.percentile(values, 5)) if values else None,
+               'p50': float(np.percentile(values, 50)) if values else None}
+        profiles.append(row)
+        stats = "".join(f"{row[k]:>9.2f}" if row[k] is not None else f"{'—':>9}" for k in ('min', 'p05', 'p50'))
+        print(f"{row['profile']:<20}{row['threshold']:>7.1f}{row['effective_threshold']:>8.1f}{hits:>9}{stats}")
+    windows = len(engine.latencies)
+    summary = {
+        'mode': engine.settings['match_mode'],
+        'audio_seconds': round(audio_seconds, 2),
+        'wall_seconds': round(wall, 3),
+        'realtime_factor': round(audio_seconds / wall, 1) if wall else None,
+        'windows': windows,
+        'windows_per_second': round(windows / wall, 1) if wall else None,
+        'latency_p50_ms': round(percentile_ms(engine.latencies, 50), 3),
+        'latency_p99_ms': round(percentile_ms(engine.latencies, 99), 3),
+        'noise_floor': round(engine.background.floor, 5),
+        'cascade_rejected': dict(engine.cascade.rejected),
+        'dtw_runs': engine.cascade.dtw_runs,
+        'dtw_pruning': dict(engine.cascade.pruning),
+        'stages': engine.timers.snapshot()['stages']
+    }
+    print(f"\nрежим {summary['mode']}: {summary['windows']} окон за {summary['wall_seconds']} с "
+          f"({summary['windows_per_second']} окон/с, x{summary['realtime_factor']} к реальному времени), "
+          f"задержка окна p50 {summary['latency_p50_ms']:.2f} мс, p99 {summary['latency_p99_ms']:.2f} мс")
+    pruning = summary['dtw_pruning']
+    if summary['dtw_runs']:
+        print(f"DTW по шаблонам: {summary['dtw_runs']}, отсеяно нижней границей {pruning['lower_bound']} "
+              f"({pruning['lower_bound'] / summary['dtw_runs']:.0%}), прервано {pruning['abandoned']}, "
+              f"посчитано полностью {pruning['completed']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'profiles': profiles, 'detections': engine.detections},
+                      f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())